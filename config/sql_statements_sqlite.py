@@ -64,11 +64,15 @@ CREATE TABLE IF NOT EXISTS video_summary (
 );
 """
 
+# 按天统计用的覆盖索引，以 view_at 开头，统计时只需扫描索引中的一段范围，无需回表
+CREATE_INDEX_DAILY = "CREATE INDEX IF NOT EXISTS idx_{table}_daily ON {table} (view_at, business, author_mid, author_name, tag_name, duration, progress);"
+
 CREATE_INDEXES = [
     "CREATE INDEX IF NOT EXISTS idx_{table}_author_mid ON {table} (author_mid);",
     "CREATE INDEX IF NOT EXISTS idx_{table}_view_at ON {table} (view_at);",
     "CREATE INDEX IF NOT EXISTS idx_{table}_remark_time ON {table} (remark_time);",
-    "CREATE INDEX IF NOT EXISTS idx_{table}_covers ON {table} (json_valid(covers));"
+    "CREATE INDEX IF NOT EXISTS idx_{table}_covers ON {table} (json_valid(covers));",
+    CREATE_INDEX_DAILY
 ]
 
 # 视频摘要表索引
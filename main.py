@@ -45,6 +45,7 @@ from routers import (
     bilibili_history_delete,
     api_security
 )
+from scripts import db_pool
 from scripts.scheduler_db_enhanced import EnhancedSchedulerDB
 from scripts.scheduler_manager import SchedulerManager
 from scripts.utils import load_config
@@ -261,6 +262,12 @@ async def lifespan(app: FastAPI):
         EnhancedSchedulerDB.get_instance()
         logger.info("已初始化增强版调度器数据库")
 
+        # 初始化SQLite连接池
+        db_pool.init_pool()
+
+        # 为旧版本创建的年份表补建按天统计索引，大表建索引较慢，放到线程中执行
+        await asyncio.to_thread(daily_count.create_daily_indexes)
+
         # 初始化调度器
         scheduler_manager = SchedulerManager.get_instance(app)
 
@@ -322,6 +329,14 @@ async def lifespan(app: FastAPI):
             except asyncio.CancelledError:
                 logger.info("调度器任务已取消")
 
+        # 关闭共享的HTTP客户端
+        await bilibili_history_delete.close_http_client()
+        await download.close_http_client()
+        await deepseek.close_http_session()
+
+        # 关闭SQLite连接池
+        db_pool.close_pool()
+
         # 恢复原始的 stdout
         if hasattr(sys.stdout, 'stdout'):
             logger.info("正在恢复标准输出...")
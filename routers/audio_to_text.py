@@ -8,11 +8,17 @@ import time
 import asyncio
 import signal
 import logging
+import threading
 import traceback
 import platform
+import gc
+import functools
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional, List, Dict, Tuple, Any
 from fastapi import APIRouter, HTTPException, BackgroundTasks
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 
 from scripts.utils import load_config
 
@@ -25,10 +31,37 @@ router = APIRouter()
 config = load_config()
 
 # 全局变量
-whisper_model = None
-model_loading = False
+# 已加载模型缓存，按 (model_size, device, compute_type) 区分，按最近使用顺序排列
+_model_cache: Dict[Tuple[str, str, str], Any] = {}
+# 各模型最后使用时间(time.monotonic)
+_last_used: Dict[Tuple[str, str, str], float] = {}
+_idle_reaper_task = None
+# 模型加载完成事件，加载期间被清除，等待中的请求在加载完成时立即被唤醒
+_model_ready = asyncio.Event()
+_model_ready.set()
 model_lock = asyncio.Lock()
 
+# 模型下载专用线程池，避免长时间的下载/转换占满默认线程池
+_DOWNLOAD_POOL = ThreadPoolExecutor(max_workers=2, thread_name_prefix="whisper-dl")
+
+# 本地转换(量化)后的模型存放目录
+CONVERTED_MODEL_DIR = os.path.join("output", "models")
+# 转换后的模型目录中记录量化类型的文件
+QUANTIZATION_FILE = "quantization.txt"
+
+# is_model_downloaded 结果缓存: {模型名称: (检查时间, (是否已下载, 模型路径))}
+_download_status_cache: Dict[str, Tuple[float, Tuple[bool, Optional[str]]]] = {}
+DOWNLOAD_STATUS_TTL = 30
+
+# Whisper 模型要求的输入采样率
+SAMPLE_RATE = 16000
+
+# 解码温度回退序列，贪心解码出现重复或低置信度时依次提高温度重试
+TEMPERATURE_FALLBACK = [0.0, 0.2, 0.4, 0.6, 0.8, 1.0]
+
+# CTranslate2 支持的量化类型
+SUPPORTED_QUANTIZATIONS = {"int8", "int8_float16", "int8_float32", "int8_bfloat16", "int16", "float16", "bfloat16", "float32"}
+
 # 检查是否是Linux系统
 is_linux = platform.system().lower() == "linux"
 
@@ -41,13 +74,13 @@ try:
         from scripts.system_resource_check import check_system_resources
         resources = check_system_resources()
         if resources["summary"]["can_run_speech_to_text"]:
-            from faster_whisper import WhisperModel
+            from faster_whisper import WhisperModel, BatchedInferencePipeline, decode_audio
             whisper_available = True
         else:
             logger.warning(f"Linux系统资源不足，不导入WhisperModel模块。限制原因: {resources.get('summary', {}).get('resource_limitation', '未知')}")
     else:
         # 非Linux系统，直接导入
-        from faster_whisper import WhisperModel
+        from faster_whisper import WhisperModel, BatchedInferencePipeline, decode_audio
         whisper_available = True
 except ImportError as e:
     logger.warning(f"导入WhisperModel失败: {str(e)}")
@@ -55,29 +88,60 @@ except Exception as e:
     logger.error(f"导入模块时出错: {str(e)}")
 
 # 添加信号处理
+async def _cleanup_models():
+    """持有模型锁卸载所有模型，正在进行的转录持有自己的模型引用，不受影响"""
+    async with model_lock:
+        for key in list(_model_cache):
+            _unload_model(key)
+    print("资源已清理")
+
 def handle_interrupt(signum, frame):
     """处理中断信号"""
-    global whisper_model
     print("\n正在清理资源...")
     try:
-        if whisper_model is not None:
-            del whisper_model
-            whisper_model = None
-        print("资源已清理")
+        # 不在信号上下文中直接释放模型，而是交给事件循环在持有模型锁时执行
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        if loop is not None:
+            loop.call_soon_threadsafe(lambda: loop.create_task(_cleanup_models()))
+        else:
+            for key in list(_model_cache):
+                _unload_model(key)
+            print("资源已清理")
     except Exception as e:
         print(f"清理资源时出错: {str(e)}")
     # 不再调用 os._exit(0)，让服务继续运行
 
-# 注册信号处理器
-signal.signal(signal.SIGINT, handle_interrupt)
-signal.signal(signal.SIGTERM, handle_interrupt)
+# 注册信号处理器，signal.signal 只能在主线程中调用
+if threading.current_thread() is threading.main_thread():
+    signal.signal(signal.SIGINT, handle_interrupt)
+    signal.signal(signal.SIGTERM, handle_interrupt)
 
 # 定义请求和响应模型
+class VadParameters(BaseModel):
+    """VAD参数，字段与 faster-whisper 的 VadOptions 一致，未指定的字段使用 faster-whisper 的默认值"""
+    model_config = ConfigDict(extra="forbid")
+
+    threshold: Optional[float] = Field(None, ge=0, le=1, description="语音概率阈值，高于该值视为语音")
+    neg_threshold: Optional[float] = Field(None, ge=0, le=1, description="静音概率阈值，低于该值视为静音")
+    min_speech_duration_ms: Optional[int] = Field(None, ge=0, description="最短语音片段时长(毫秒)，更短的片段会被丢弃")
+    max_speech_duration_s: Optional[float] = Field(None, gt=0, description="最长语音片段时长(秒)，超出时在静音处切分")
+    min_silence_duration_ms: Optional[int] = Field(None, ge=0, description="切分语音片段所需的最短静音时长(毫秒)")
+    speech_pad_ms: Optional[int] = Field(None, ge=0, description="语音片段两端各扩展的时长(毫秒)")
+
 class TranscribeRequest(BaseModel):
     audio_path: str = Field(..., description="音频文件路径，可以是相对路径或绝对路径")
     model_size: str = Field("tiny", description="模型大小，可选值: tiny, base, small, medium, large-v1, large-v2, large-v3")
     language: str = Field("zh", description="语言代码，默认为中文")
     cid: int = Field(..., description="视频的CID，用于分类存储和命名结果")
+    batch_size: int = Field(16, ge=1, description="批量推理大小，启用VAD时多个语音片段合并为一批送入模型")
+    beam_size: int = Field(1, ge=1, description="解码束宽，1为贪心解码(速度最快，配合温度回退准确率损失很小)，增大可略微提升准确率但解码计算量成倍增加")
+    vad_parameters: VadParameters = Field(
+        default_factory=lambda: VadParameters(min_silence_duration_ms=500, speech_pad_ms=200),
+        description="VAD参数，启用VAD时编码器只处理语音片段，静音越多节省的计算量越大"
+    )
 
 class TranscribeResponse(BaseModel):
     success: bool = Field(..., description="是否成功")
@@ -131,9 +195,87 @@ class ResourceCheckResponse(BaseModel):
     can_run_speech_to_text: bool = Field(..., description="是否可以运行语音转文字功能")
     limitation_reason: Optional[str] = Field(None, description="限制原因")
 
+def _unload_model(key):
+    """
+    从缓存中卸载模型并释放内存/显存
+
+    没有正在进行的转录时，先显式卸载CTranslate2模型，确定性地归还显存，
+    再释放Python侧的引用；正在使用的模型只从缓存中移除，转录结束后由垃圾回收释放。
+    """
+    model = _model_cache.pop(key, None)
+    _last_used.pop(key, None)
+    if model is not None:
+        if getattr(model, "active_requests", 0) == 0:
+            try:
+                model.model.unload_model()
+            except Exception as e:
+                logger.warning(f"卸载模型权重时出错: {str(e)}")
+        del model
+        gc.collect()
+        logger.info(f"已卸载模型: {key[0]} ({key[1]}, {key[2]})")
+
+async def _idle_reaper():
+    """定期卸载超过空闲时间未使用的模型"""
+    while True:
+        await asyncio.sleep(60)
+        idle_timeout = config.get("stt", {}).get("idle_timeout", 600)
+        if not idle_timeout:
+            continue
+        now = time.monotonic()
+        async with model_lock:
+            for key in [
+                k for k, last_used in _last_used.items()
+                if now - last_used > idle_timeout and getattr(_model_cache.get(k), "active_requests", 0) == 0
+            ]:
+                logger.info(f"模型 {key[0]} 空闲超过 {idle_timeout} 秒，准备卸载")
+                _unload_model(key)
+
+def _ensure_idle_reaper():
+    """首次加载模型时启动空闲卸载任务"""
+    global _idle_reaper_task
+    if _idle_reaper_task is None or _idle_reaper_task.done():
+        _idle_reaper_task = asyncio.create_task(_idle_reaper())
+
+def _touch_model(model):
+    """更新模型的最后使用时间"""
+    key = getattr(model, "cache_key", None)
+    if key in _model_cache:
+        _last_used[key] = time.monotonic()
+
+def _create_whisper_model(model_source, device, compute_type):
+    """
+    创建WhisperModel实例
+
+    在GPU上启用flash attention，并使用2个worker让并发的转录请求在同一设备上并行执行，
+    每个额外的worker约多占用200MB显存；旧版CTranslate2不支持时回退为默认参数。
+    """
+    if device == "cuda":
+        try:
+            return WhisperModel(
+                model_source,
+                device=device,
+                compute_type=compute_type or "auto",
+                num_workers=2,
+                flash_attention=True
+            )
+        except Exception as e:
+            logger.warning(f"启用flash attention失败，使用默认参数加载模型: {str(e)}")
+    return WhisperModel(model_source, device=device or "auto", compute_type=compute_type or "auto")
+
+def _warmup_model(model):
+    """用一段2秒的静音执行一次完整的编码+解码，完成首次推理的初始化"""
+    import numpy as np
+    segments, _ = model.transcribe(
+        np.zeros(SAMPLE_RATE * 2, dtype=np.float32),
+        language="zh",
+        vad_filter=False,
+        beam_size=1
+    )
+    list(segments)
+
 async def load_model(model_size, device=None, compute_type=None):
-    """加载Whisper模型"""
-    global whisper_model, model_loading
+    """加载Whisper模型，已加载的模型会被缓存复用，空闲超时后自动卸载"""
+    key = (model_size, device or "auto", compute_type or "auto")
     
     # 检查是否可以使用WhisperModel
     if not whisper_available:
@@ -147,10 +289,12 @@ async def load_model(model_size, device=None, compute_type=None):
         )
     
     try:
-        # 检查是否已加载相同型号的模型
-        if whisper_model is not None and whisper_model.model_size == model_size:
+        # 检查是否已加载相同配置的模型
+        cached_model = _model_cache.get(key)
+        if cached_model is not None:
             logger.info(f"使用已加载的模型: {model_size}")
-            return whisper_model
+            _touch_model(cached_model)
+            return cached_model
             
         # 检查模型是否已下载
         is_downloaded, model_path = is_model_downloaded(model_size)
@@ -165,38 +309,62 @@ async def load_model(model_size, device=None, compute_type=None):
                 }
             )
             
-        # 如果其他进程正在加载模型，等待
-        if model_loading:
-            logger.info("其他进程正在加载模型，等待...")
-            wait_start = time.time()
-            while model_loading:
-                # 添加超时检查
-                if time.time() - wait_start > 300:  # 5分钟超时
+        # 如果其他请求正在加载模型，等待加载完成
+        if not _model_ready.is_set():
+            logger.info("其他请求正在加载模型，等待...")
+            wait_deadline = time.monotonic() + 300  # 5分钟超时
+            # 被唤醒时可能已有其他等待者开始了新的加载，因此循环检查
+            while not _model_ready.is_set():
+                try:
+                    await asyncio.wait_for(_model_ready.wait(), timeout=max(0, wait_deadline - time.monotonic()))
+                except asyncio.TimeoutError:
                     raise HTTPException(
                         status_code=500,
                         detail="等待模型加载超时，请稍后重试"
                     )
-                await asyncio.sleep(1)
-            if whisper_model is not None and whisper_model.model_size == model_size:
-                return whisper_model
+            cached_model = _model_cache.get(key)
+            if cached_model is not None:
+                _touch_model(cached_model)
+                return cached_model
         
-        model_loading = True
+        _model_ready.clear()
         start_time = time.time()
         logger.info(f"开始加载模型: {model_size}")
         
         try:
             # 创建WhisperModel实例 - 使用同步方式加载模型，避免事件循环问题
+            # 本地转换的量化模型直接按目录加载，否则按模型名从缓存加载
+            model_source = model_path if os.path.isfile(os.path.join(model_path, "model.bin")) else model_size
             loop = asyncio.get_running_loop()
             whisper_model = await loop.run_in_executor(
                 None, 
-                lambda: WhisperModel(model_size, device=device or "auto", compute_type=compute_type or "auto")
+                _create_whisper_model, model_source, device, compute_type
             )
             
             load_time = time.time() - start_time
             logger.info(f"模型加载完成，耗时 {load_time:.2f} 秒")
             
+            # 预热模型，避免首个真实请求承担首次推理的初始化开销
+            warmup_start = time.time()
+            await loop.run_in_executor(None, _warmup_model, whisper_model)
+            logger.info(f"模型预热完成，耗时 {time.time() - warmup_start:.2f} 秒")
+            
             # 存储模型大小信息
             whisper_model.model_size = model_size
+            whisper_model.cache_key = key
+            # 正在使用该模型的转录数量，大于0时不会被空闲卸载
+            whisper_model.active_requests = 0
+            # 批量推理管线，多个VAD片段一次性送入编码器/解码器
+            whisper_model.batched_pipeline = BatchedInferencePipeline(model=whisper_model)
+            
+            # 超出缓存数量时卸载最久未使用的模型
+            max_loaded_models = max(1, config.get("stt", {}).get("max_loaded_models", 1))
+            async with model_lock:
+                while _last_used and len(_model_cache) >= max_loaded_models:
+                    _unload_model(min(_last_used, key=_last_used.get))
+                _model_cache[key] = whisper_model
+                _last_used[key] = time.monotonic()
+            _ensure_idle_reaper()
             return whisper_model
             
         except Exception as e:
@@ -206,6 +374,9 @@ async def load_model(model_size, device=None, compute_type=None):
                 status_code=500,
                 detail=f"模型加载失败: {str(e)}"
             )
+        finally:
+            _model_ready.set()
+            logger.info("模型加载状态已重置")
             
     except Exception as e:
         if isinstance(e, HTTPException):
@@ -216,41 +387,104 @@ async def load_model(model_size, device=None, compute_type=None):
             status_code=500,
             detail=f"模型加载过程出错: {str(e)}"
         )
-    finally:
-        model_loading = False
-        logger.info("模型加载状态已重置")
+
+@functools.lru_cache(maxsize=1)
+def detect_gpu() -> Tuple[bool, Optional[int]]:
+    """
+    检测是否有可用的CUDA设备及第一块GPU的显存大小，结果在进程内缓存
+
+    Returns:
+        (是否有可用GPU, 显存大小MB，无法获取时为None)
+    """
+    try:
+        import ctranslate2
+        if ctranslate2.get_cuda_device_count() == 0:
+            return False, None
+    except Exception as e:
+        logger.warning(f"检测CUDA设备失败: {str(e)}")
+        return False, None
+    
+    import subprocess
+    try:
+        result = subprocess.run(
+            ['nvidia-smi', '--query-gpu=memory.total', '--format=csv,noheader,nounits'],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+        )
+        if result.returncode == 0:
+            return True, int(result.stdout.splitlines()[0].strip())
+    except (FileNotFoundError, subprocess.SubprocessError, ValueError, IndexError):
+        pass
+    return True, None
+
+def select_device_and_compute_type(model_size: str) -> Tuple[str, str]:
+    """
+    选择推理设备和计算类型
+
+    有GPU时使用float16；large模型在显存不足8GB的GPU上使用int8_float16以减半显存占用；
+    没有GPU时使用CPU int8。
+    """
+    has_gpu, total_memory_mb = detect_gpu()
+    if not has_gpu:
+        return "cpu", "int8"
+    if model_size.startswith("large") and total_memory_mb is not None and total_memory_mb < 8192:
+        return "cuda", "int8_float16"
+    return "cuda", "float16"
 
 def format_timestamp(seconds):
     """将秒转换为完整的时间戳格式 HH:MM:SS"""
-    hours = int(seconds // 3600)
-    minutes = int((seconds % 3600) // 60)
-    seconds_int = int(seconds % 60)
+    minutes, seconds_int = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
     
     # 始终返回完整的 HH:MM:SS 格式
     return f"{hours:02d}:{minutes:02d}:{seconds_int:02d}"
 
-def save_transcript(all_segments, output_path):
-    """保存转录结果为简洁格式，适合节省token"""
+def save_transcript(segments, output_path):
+    """保存转录结果为简洁格式，适合节省token
+
+    segments 可以直接是 faster-whisper 返回的生成器，片段在解码过程中逐条写入
+    临时文件 output_path.part，全部完成后再替换为正式文件；长音频转录中途失败时
+    已完成的部分仍保留在临时文件中，且不会被误判为已完成的转录结果。
+
+    Returns:
+        int: 写入的片段数量
+    """
     print(f"准备保存转录结果到: {output_path}")
-    print(f"处理的片段数量: {len(all_segments)}")
-    
+
+    segment_count = 0
+    partial_path = f"{output_path}.part"
+    _fmt = format_timestamp
     # 整理数据：移除多余的空格和控制字符
-    with open(output_path, "w", encoding="utf-8") as f:
+    # 以二进制模式写入并使用1MiB缓冲区，直接写入编码后的字节，减少系统调用
+    with open(partial_path, "wb", buffering=1 << 20) as f:
         # 所有片段放在一行，用空格分隔
-        transcript_lines = []
-        for segment in all_segments:
+        for segment in segments:
             # 清理文本，替换实际换行符为空格，去除多余空格
             text = segment.text.strip().replace("\n", " ")
-            start_time = format_timestamp(segment.start)
-            end_time = format_timestamp(segment.end)
-            # 格式化内容并添加到列表
-            transcript_lines.append(f"{start_time}>{end_time}: {text}")
-        # 将所有片段用空格连接并写入一行
-        f.write(" ".join(transcript_lines))
-    
+            start_time = _fmt(segment.start)
+            end_time = _fmt(segment.end)
+            if segment_count:
+                f.write(b" ")
+            f.write(f"{start_time}>{end_time}: {text}".encode("utf-8"))
+            segment_count += 1
+    os.replace(partial_path, output_path)
+
+    print(f"处理的片段数量: {segment_count}")
     print(f"转录结果已保存: {output_path}")
+    return segment_count
 
-async def transcribe_audio(audio_path, model_size="medium", language="zh", cid=None):
+def load_audio(audio_path):
+    """
+    读取并解码音频为16kHz单声道float32数组
+
+    打开文件后提示内核按顺序读取(POSIX_FADV_SEQUENTIAL)，加大预读窗口，
+    让磁盘读取与解码重叠；不支持posix_fadvise的系统上直接解码。
+    """
+    with open(audio_path, "rb") as f:
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        return decode_audio(f, sampling_rate=SAMPLE_RATE)
+
+async def transcribe_audio(audio_path, model_size="medium", language="zh", cid=None, batch_size=16, vad_parameters=None, beam_size=1):
     """
     转录音频文件为文本
     
@@ -259,6 +493,9 @@ async def transcribe_audio(audio_path, model_size="medium", language="zh", cid=N
         model_size: 模型大小
         language: 语言代码
         cid: 视频CID
+        batch_size: 批量推理大小
+        vad_parameters: VAD参数，仅在启用VAD时生效
+        beam_size: 解码束宽，1为贪心解码
         
     Returns:
         dict: 转录结果字典
@@ -281,40 +518,54 @@ async def transcribe_audio(audio_path, model_size="medium", language="zh", cid=N
     
     print(f"开始处理音频文件: {audio_path}")
     
+    whisper_model = None
     try:
-        # 检测是否有GPU可用
-        import subprocess
-        has_gpu = False
-        try:
-            # 尝试使用nvidia-smi命令检测GPU
-            result = subprocess.run(['nvidia-smi'], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            has_gpu = (result.returncode == 0)
-        except (FileNotFoundError, subprocess.SubprocessError):
-            # 命令不存在或执行失败，认为没有GPU
-            has_gpu = False
-            
-        # 选择设备和计算类型
-        device = "cuda" if has_gpu else "cpu"
-        compute_type = "float16" if has_gpu else "int8"
+        # 根据GPU和显存情况选择设备和计算类型，首次检测会调用 nvidia-smi，放到线程中执行以免阻塞事件循环
+        device, compute_type = await asyncio.to_thread(select_device_and_compute_type, model_size)
         
         print(f"使用设备: {device}, 计算类型: {compute_type}")
         
         # 加载模型
-        global whisper_model
         whisper_model = await load_model(model_size, device, compute_type)
+        whisper_model.active_requests += 1
+        
+        # 只解码一次为16kHz单声道float32数组，直接交给模型，避免模型内部再次打开并解码文件
+        loop = asyncio.get_running_loop()
+        audio = await loop.run_in_executor(None, load_audio, audio_path)
+        audio_duration = len(audio) / SAMPLE_RATE
+        
+        # 短音频跳过VAD，VAD模型的加载和推理开销可能超过转录本身
+        vad_min_seconds = config.get("stt", {}).get("vad_min_seconds", 30)
+        use_vad = audio_duration > vad_min_seconds
+        logger.info(f"音频时长: {audio_duration:.2f} 秒, 是否启用VAD: {use_vad}")
         
         # 转录音频
-        segments, info = whisper_model.transcribe(
-            audio_path,
-            language=language,
-            task="transcribe",
-            beam_size=5
-        )
+        # 批量推理依赖VAD切分的片段，启用VAD时总是使用批量推理
+        if use_vad:
+            logger.info(f"使用批量推理，batch_size: {batch_size}")
+            segments, info = whisper_model.batched_pipeline.transcribe(
+                audio,
+                language=language,
+                task="transcribe",
+                beam_size=beam_size,
+                temperature=TEMPERATURE_FALLBACK,
+                vad_filter=True,
+                vad_parameters=dict(vad_parameters) if vad_parameters else None,
+                batch_size=batch_size
+            )
+        else:
+            segments, info = whisper_model.transcribe(
+                audio,
+                language=language,
+                task="transcribe",
+                beam_size=beam_size,
+                temperature=TEMPERATURE_FALLBACK,
+                vad_filter=use_vad,
+                vad_parameters=dict(vad_parameters) if use_vad and vad_parameters else None
+            )
         
         # 处理结果
         logger.info("处理转录结果...")
-        all_segments = list(segments)
-        logger.info(f"转录得到 {len(all_segments)} 个片段")
         
         # 如果指定了CID，保存到对应目录
         if cid:
@@ -322,11 +573,17 @@ async def transcribe_audio(audio_path, model_size="medium", language="zh", cid=N
             save_dir = os.path.join("output", "stt", str(cid))
             os.makedirs(save_dir, exist_ok=True)
             
-            # 保存JSON格式
+            # 保存JSON格式，片段随解码进度直接写入文件
+            # 解码在遍历segments时才真正执行，放到线程池中进行，避免长时间阻塞事件循环
             json_path = os.path.join(save_dir, f"{cid}.json")
             logger.info(f"保存JSON格式到: {json_path}")
-            save_transcript(all_segments, json_path)
+            segment_count = await loop.run_in_executor(None, save_transcript, segments, json_path)
+            logger.info(f"转录得到 {segment_count} 个片段")
             logger.info("转录结果保存完成")
+        else:
+            # 不保存结果时只需遍历生成器完成解码，只计数而不保留片段对象
+            segment_count = await loop.run_in_executor(None, lambda: sum(1 for _ in segments))
+            logger.info(f"转录得到 {segment_count} 个片段")
         
         processing_time = time.time() - start_time
         logger.info(f"总处理时间: {processing_time:.2f} 秒")
@@ -334,7 +591,7 @@ async def transcribe_audio(audio_path, model_size="medium", language="zh", cid=N
         return {
             "success": True,
             "message": "转录完成",
-            "duration": info.duration,
+            "duration": audio_duration,
             "language_detected": info.language,
             "processing_time": processing_time
         }
@@ -349,6 +606,10 @@ async def transcribe_audio(audio_path, model_size="medium", language="zh", cid=N
             status_code=500,
             detail=str(e)
         )
+    finally:
+        if whisper_model is not None:
+            whisper_model.active_requests -= 1
+            _touch_model(whisper_model)
 
 @router.post("/transcribe", response_model=TranscribeResponse, summary="转录音频文件")
 async def transcribe_audio_api(request: TranscribeRequest, background_tasks: BackgroundTasks):
@@ -378,7 +639,10 @@ async def transcribe_audio_api(request: TranscribeRequest, background_tasks: Bac
             request.audio_path, 
             model_size=request.model_size, 
             language=request.language, 
-            cid=request.cid
+            cid=request.cid,
+            batch_size=request.batch_size,
+            vad_parameters=request.vad_parameters.model_dump(exclude_none=True),
+            beam_size=request.beam_size
         )
         
         processing_time = time.time() - start_time
@@ -481,9 +745,13 @@ async def list_models():
         }
     ]
     
+    # 并发检查各模型的下载状态，冷缓存时总耗时取决于最慢的一次检查而不是全部之和
+    download_statuses = await asyncio.gather(
+        *[asyncio.to_thread(is_model_downloaded, model_info["name"]) for model_info in model_infos]
+    )
+    
     result = []
-    for model_info in model_infos:
-        is_downloaded, model_path = is_model_downloaded(model_info["name"])
+    for model_info, (is_downloaded, model_path) in zip(model_infos, download_statuses):
         result.append(WhisperModelInfo(
             name=model_info["name"],
             description=model_info["description"],
@@ -510,18 +778,24 @@ async def find_audio_by_cid(cid: int):
         # 构建基础下载目录路径
         base_dir = os.path.join("./output/download_video")
         
-        # 遍历所有文件夹，查找包含_cid的文件夹
+        # 下载目录按 {title}_{username}_{date}_{cid} 命名，只需检查顶层目录，无需递归遍历整棵目录树
         audio_path = None
-        for root, dirs, files in os.walk(base_dir):
-            # 检查目录名是否以_cid结尾
-            if root.endswith(f"_{cid}"):
-                # 在该目录下查找包含_cid的文件
-                for file in files:
-                    if file.endswith(f"_{cid}.m4a") or file.endswith(f"_{cid}.mp3") or file.endswith(f"_{cid}.wav"):
-                        audio_path = os.path.join(root, file)
+        dir_suffix = f"_{cid}"
+        file_suffixes = (f"_{cid}.m4a", f"_{cid}.mp3", f"_{cid}.wav")
+        if os.path.isdir(base_dir):
+            with os.scandir(base_dir) as dir_entries:
+                for dir_entry in dir_entries:
+                    # 检查目录名是否以_cid结尾
+                    if not (dir_entry.is_dir() and dir_entry.name.endswith(dir_suffix)):
+                        continue
+                    # 在该目录下查找包含_cid的文件
+                    with os.scandir(dir_entry.path) as file_entries:
+                        for file_entry in file_entries:
+                            if file_entry.name.endswith(file_suffixes):
+                                audio_path = file_entry.path
+                                break
+                    if audio_path:
                         break
-                if audio_path:
-                    break
         
         if not audio_path:
             raise HTTPException(
@@ -534,6 +808,8 @@ async def find_audio_by_cid(cid: int):
             "audio_path": audio_path
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -704,22 +980,80 @@ async def check_environment():
             detail=f"环境检查失败: {str(e)}"
         )
 
+def get_converted_model_dir(model_name: str) -> str:
+    """获取本地转换(量化)后的模型目录"""
+    return os.path.join(CONVERTED_MODEL_DIR, f"faster-whisper-{model_name}")
+
+def get_model_quantization(model_dir: str) -> Optional[str]:
+    """读取本地转换模型的量化类型，非本地转换的模型或旧版本转换的模型返回 None"""
+    try:
+        with open(os.path.join(model_dir, QUANTIZATION_FILE), encoding="utf-8") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+def convert_model(model_size: str, quantization: str) -> str:
+    """
+    下载 openai/whisper 原始模型并直接转换为指定量化精度的CTranslate2模型
+
+    只保存量化后的权重，避免在缓存中保留完整精度的 model.bin。
+    先转换到临时目录，完成后再整体移动到位，转换中途失败不会留下不完整的模型目录。
+    依赖 transformers，未安装时抛出 ImportError。
+
+    Returns:
+        转换后的模型目录
+    """
+    from ctranslate2.converters import TransformersConverter
+
+    output_dir = get_converted_model_dir(model_size)
+    os.makedirs(CONVERTED_MODEL_DIR, exist_ok=True)
+    # 临时目录与目标目录位于同一文件系统，os.replace 才能原子地完成移动
+    tmp_dir = tempfile.mkdtemp(prefix=f".faster-whisper-{model_size}-", dir=CONVERTED_MODEL_DIR)
+    try:
+        converter = TransformersConverter(
+            f"openai/whisper-{model_size}",
+            copy_files=["tokenizer.json", "preprocessor_config.json"]
+        )
+        converter.convert(tmp_dir, quantization=quantization, force=True)
+        with open(os.path.join(tmp_dir, QUANTIZATION_FILE), "w", encoding="utf-8") as f:
+            f.write(quantization)
+        # 清理旧版本中断转换后留下的、缺少 model.bin 的目录
+        if os.path.isdir(output_dir):
+            shutil.rmtree(output_dir)
+        os.replace(tmp_dir, output_dir)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    return output_dir
+
 @router.post("/download_model", summary="下载指定的Whisper模型")
-async def download_model(model_size: str):
+async def download_model(model_size: str, quantization: str = "int8"):
     """
     下载指定的Whisper模型
     
     Args:
         model_size: 模型大小，可选值: tiny, base, small, medium, large-v1, large-v2, large-v3
+        quantization: 量化类型，默认int8，可选值: int8, int8_float16, int8_float32, int8_bfloat16, int16, float16, bfloat16, float32
     """
     try:
-        # 检查模型是否已下载
+        if quantization not in SUPPORTED_QUANTIZATIONS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"不支持的量化类型: {quantization}，可选值: {', '.join(sorted(SUPPORTED_QUANTIZATIONS))}"
+            )
+        
+        # 检查模型是否已下载，同一模型只保留一份，已下载时返回现有模型的量化类型
         is_downloaded, model_path = is_model_downloaded(model_size)
         if is_downloaded:
+            existing_quantization = get_model_quantization(model_path)
+            message = f"模型 {model_size} 已下载"
+            if existing_quantization != quantization:
+                message += f"（量化类型: {existing_quantization or '未知'}），如需使用 {quantization} 量化请先删除该模型后重新下载"
             return {
                 "status": "already_downloaded",
-                "message": f"模型 {model_size} 已下载",
-                "model_path": model_path
+                "message": message,
+                "model_path": model_path,
+                "quantization": existing_quantization
             }
         
         # 创建临时的WhisperModel实例来触发下载
@@ -728,16 +1062,26 @@ async def download_model(model_size: str):
         start_time = time.time()
         
         # 使用线程执行器来避免阻塞
-        loop = asyncio.get_event_loop()
-        await loop.run_in_executor(
-            None,
-            lambda: WhisperModel(model_size, device="cpu", compute_type="int8")
-        )
+        loop = asyncio.get_running_loop()
+        try:
+            # 优先下载原始模型并直接转换为量化模型，磁盘占用和加载时间更少
+            await loop.run_in_executor(
+                _DOWNLOAD_POOL,
+                functools.partial(convert_model, model_size, quantization)
+            )
+        except ImportError as e:
+            # 未安装transformers时回退为下载预转换的faster-whisper模型
+            logger.warning(f"无法进行模型量化转换，改为下载预转换模型: {str(e)}")
+            await loop.run_in_executor(
+                _DOWNLOAD_POOL,
+                functools.partial(WhisperModel, model_size, device="cpu", compute_type="int8")
+            )
         
         download_time = time.time() - start_time
         logger.info(f"模型下载完成，耗时: {download_time:.2f} 秒")
         
         # 再次检查模型是否已下载
+        _download_status_cache.pop(model_size, None)
         is_downloaded, model_path = is_model_downloaded(model_size)
         if not is_downloaded:
             raise HTTPException(
@@ -752,6 +1096,8 @@ async def download_model(model_size: str):
             "download_time": f"{download_time:.2f}秒"
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"模型下载失败: {str(e)}")
         logger.error(f"错误堆栈: {traceback.format_exc()}")
@@ -831,8 +1177,7 @@ async def delete_model(request: DeleteModelRequest):
             }
         
         # 如果模型正在使用中，不允许删除
-        global whisper_model
-        if whisper_model is not None and whisper_model.model_size == request.model_size:
+        if any(key[0] == request.model_size for key in _model_cache):
             return {
                 "success": False,
                 "message": f"模型 {request.model_size} 当前正在使用中，无法删除。请先关闭使用该模型的任务后再尝试删除。",
@@ -840,10 +1185,10 @@ async def delete_model(request: DeleteModelRequest):
             }
         
         # 删除模型文件
-        import shutil
         try:
             if model_path and os.path.exists(model_path):
                 shutil.rmtree(model_path)
+                _download_status_cache.pop(request.model_size, None)
                 logger.info(f"已成功删除模型: {request.model_size}，路径: {model_path}")
                 return {
                     "success": True,
@@ -908,7 +1253,7 @@ async def check_stt_file(cid: int):
         )
 
 def is_model_downloaded(model_name: str) -> Tuple[bool, Optional[str]]:
-    """检查模型是否已下载
+    """检查模型是否已下载，结果缓存 DOWNLOAD_STATUS_TTL 秒，下载或删除模型后失效
     
     Args:
         model_name: 模型名称
@@ -916,6 +1261,21 @@ def is_model_downloaded(model_name: str) -> Tuple[bool, Optional[str]]:
     Returns:
         (是否已下载, 模型路径)
     """
+    cached = _download_status_cache.get(model_name)
+    if cached is not None and time.monotonic() - cached[0] < DOWNLOAD_STATUS_TTL:
+        return cached[1]
+    
+    result = _check_model_downloaded(model_name)
+    _download_status_cache[model_name] = (time.monotonic(), result)
+    return result
+
+def _check_model_downloaded(model_name: str) -> Tuple[bool, Optional[str]]:
+    """检查模型文件是否存在于本地转换目录或 huggingface 缓存目录"""
+    # 优先检查本地转换的量化模型
+    converted_dir = get_converted_model_dir(model_name)
+    if os.path.isfile(os.path.join(converted_dir, "model.bin")):
+        return True, converted_dir
+        
     # 首先检查操作系统类型，决定缓存目录的位置
     if os.name == 'nt':  # Windows
         cache_dir = os.path.join(os.environ.get('USERPROFILE', ''), '.cache', 'huggingface', 'hub')
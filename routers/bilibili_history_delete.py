@@ -5,7 +5,7 @@ B站历史记录删除API
 
 from typing import List
 
-import requests
+import httpx
 from fastapi import APIRouter, Query
 from pydantic import BaseModel, Field
 
@@ -13,6 +13,18 @@ from scripts.utils import load_config
 
 router = APIRouter()
 
+# 复用连接的异步HTTP客户端，避免阻塞事件循环，在应用关闭时由 close_http_client 关闭
+# 固定不变的请求头设置在客户端上，每次请求只需附加Cookie
+_http = httpx.AsyncClient(
+    timeout=10.0,
+    headers={
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+        'Referer': 'https://www.bilibili.com/',
+        'Origin': 'https://www.bilibili.com',
+        'Content-Type': 'application/x-www-form-urlencoded',
+    }
+)
+
 class DeleteHistoryItem(BaseModel):
     """删除历史记录项目模型"""
     kid: str = Field(..., description="删除的目标记录，格式为{业务类型}_{目标id}")
@@ -22,16 +34,20 @@ class BatchDeleteRequest(BaseModel):
     """批量删除请求模型"""
     items: List[DeleteHistoryItem] = Field(..., description="要删除的历史记录列表")
 
-def get_headers():
-    """获取请求头"""
+async def close_http_client():
+    """关闭共享的HTTP客户端"""
+    await _http.aclose()
+
+def get_headers(current_config=None):
+    """获取请求头中随登录状态变化的部分，通用请求头已设置在共享客户端上
+
+    Args:
+        current_config: 已加载的配置，为None时重新读取配置文件
+    """
     # 动态读取配置文件，获取最新的SESSDATA
-    current_config = load_config()
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-        'Referer': 'https://www.bilibili.com/',
-        'Origin': 'https://www.bilibili.com',
-        'Content-Type': 'application/x-www-form-urlencoded',
-    }
+    if current_config is None:
+        current_config = load_config()
+    headers = {}
 
     # 添加Cookie
     cookies = []
@@ -83,8 +99,8 @@ async def delete_single_history(
             }
 
             # 发送请求
-            headers = get_headers()
-            response = requests.post(
+            headers = get_headers(current_config)
+            response = await _http.post(
                 "https://api.bilibili.com/x/v2/history/delete",
                 data=data,  # 使用form-urlencoded格式
                 headers=headers
@@ -145,16 +161,18 @@ async def batch_delete_history(request: BatchDeleteRequest):
 
         # 如果有需要同步删除的记录
         if sync_items:
+            # 去除重复的kid并保持原有顺序，避免重复提交给B站接口
+            unique_kids = list(dict.fromkeys(item.kid for item in sync_items))
             # 准备请求参数 - 支持批量删除，用逗号分隔多个kid
-            kids = ",".join([item.kid for item in sync_items])
+            kids = ",".join(unique_kids)
             data = {
                 "kid": kids,
                 "csrf": bili_jct
             }
 
             # 发送请求
-            headers = get_headers()
-            response = requests.post(
+            headers = get_headers(current_config)
+            response = await _http.post(
                 "https://api.bilibili.com/x/v2/history/delete",
                 data=data,  # 使用form-urlencoded格式
                 headers=headers
@@ -164,19 +182,19 @@ async def batch_delete_history(request: BatchDeleteRequest):
             result = response.json()
 
             if result.get("code") == 0:
-                success_count += len(sync_items)
-                for item in sync_items:
+                success_count += len(unique_kids)
+                for kid in unique_kids:
                     results.append({
-                        "kid": item.kid,
+                        "kid": kid,
                         "sync_to_bilibili": True,
                         "status": "success"
                     })
             else:
-                error_count += len(sync_items)
+                error_count += len(unique_kids)
                 error_message = result.get('message', '未知错误')
-                for item in sync_items:
+                for kid in unique_kids:
                     results.append({
-                        "kid": item.kid,
+                        "kid": kid,
                         "sync_to_bilibili": True,
                         "status": "error",
                         "message": error_message
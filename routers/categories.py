@@ -1,44 +1,92 @@
+import json
+import logging
 import sqlite3
+import threading
+import time
 from fastapi import APIRouter
-from scripts.init_categories import init_categories
-from scripts.utils import get_output_path, load_config
+from fastapi.responses import Response
+from scripts.db_pool import borrow, on_reset
+from scripts.init_categories import ensure_category_index, init_categories
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
+
+# 分类表是否已确认存在，确认后不再每次请求都查询 sqlite_master
+_table_ready = False
+_table_lock = threading.Lock()
+
+# 分类数据几乎不变（只在 /init 时重建），查询结果在进程内缓存
+# 键: 'categories' / 'main' / ('sub', 主分类)，值: (缓存时间, 数据)
+CATEGORY_CACHE_TTL = 3600
+_category_cache = {}
+
+def _get_cached(key):
+    """读取未过期的缓存数据，不存在或已过期返回 None"""
+    entry = _category_cache.get(key)
+    if entry and time.monotonic() - entry[0] < CATEGORY_CACHE_TTL:
+        return entry[1]
+    return None
+
+def _set_cached(key, data):
+    _category_cache[key] = (time.monotonic(), data)
+
+def _reset_cache():
+    """清空分类缓存，下次请求时重新检查分类表"""
+    global _table_ready
+    _table_ready = False
+    _category_cache.clear()
+
+# 重置数据库后分类表和缓存的数据都已失效
+on_reset(_reset_cache)
 
 def get_db():
-    """获取数据库连接"""
-    config = load_config()
-    db_path = get_output_path(config['db_file'])
-    return sqlite3.connect(db_path)
+    """从连接池借出数据库连接，需配合 with 使用"""
+    return borrow()
+
+def _category_table_exists(cursor) -> bool:
+    cursor.execute('''
+        SELECT name FROM sqlite_master 
+        WHERE type='table' AND name='video_categories'
+    ''')
+    return cursor.fetchone() is not None
 
 def ensure_table_exists():
-    """确保分类表存在，如果不存在则初始化"""
-    try:
-        conn = get_db()
-        cursor = conn.cursor()
-        
-        # 检查表是否存在
-        cursor.execute('''
-            SELECT name FROM sqlite_master 
-            WHERE type='table' AND name='video_categories'
-        ''')
-        
-        if not cursor.fetchone():
-            print("分类表不存在，正在初始化...")
-            init_categories()
-            print("分类表初始化完成")
-            
-    except sqlite3.Error as e:
-        print(f"检查表存在时发生错误: {e}")
-    finally:
-        if conn:
-            conn.close()
+    """确保分类表存在，如果不存在则初始化；确认存在后后续调用直接返回"""
+    global _table_ready
+    if _table_ready:
+        return
+
+    with _table_lock:
+        if _table_ready:
+            return
+
+        try:
+            with get_db() as conn:
+                cursor = conn.cursor()
+                if not _category_table_exists(cursor):
+                    logger.debug("分类表不存在，正在初始化...")
+                    init_categories()
+                    logger.debug("分类表初始化完成")
+                    # init_categories 出错时只记录日志，这里再确认一次
+                    if not _category_table_exists(cursor):
+                        return
+
+                # 兼容旧数据库：表已存在但缺少索引
+                ensure_category_index(cursor)
+                conn.commit()
+
+            _table_ready = True
+
+        except sqlite3.Error as e:
+            logger.error("检查表存在时发生错误: %s", e)
 
 @router.post("/init", summary="初始化视频分类数据")
 async def initialize_categories():
     """初始化视频分类数据"""
     try:
         init_categories()
+        # 初始化失败时 init_categories 只打印错误，交给下次请求重新检查
+        _reset_cache()
         return {
             "status": "success",
             "message": "视频分类表初始化成功"
@@ -52,83 +100,76 @@ async def initialize_categories():
 @router.get("/categories", summary="获取所有分类信息")
 async def get_categories():
     """获取所有分类信息"""
+    # 缓存的是序列化好的响应体，命中时跳过 jsonable_encoder 和 json.dumps
+    cached = _get_cached('categories')
+    if cached is not None:
+        return Response(content=cached, media_type="application/json")
+
     try:
         # 确保表存在
         ensure_table_exists()
         
-        conn = get_db()
-        cursor = conn.cursor()
-        
-        # 查询所有分类
-        cursor.execute('''
-        SELECT main_category, sub_category, alias, tid, image 
-        FROM video_categories 
-        ORDER BY main_category, sub_category
-        ''')
-        
-        # 构建分类树
-        categories = {}
-        for row in cursor.fetchall():
-            main_cat, sub_cat, alias, tid, image = row
-            
-            if main_cat not in categories:
-                categories[main_cat] = {
+        with get_db() as conn:
+            cursor = conn.cursor()
+
+            # 查询所有分类，由 SQLite 按主分类分组并直接生成子分类 JSON 数组
+            cursor.execute('''
+            SELECT main_category, MIN(image) AS image,
+                   json_group_array(json_object('name', sub_category, 'alias', alias, 'tid', tid))
+                       FILTER (WHERE sub_category != main_category) AS sub_categories
+            FROM video_categories
+            GROUP BY main_category
+            ORDER BY main_category
+            ''')
+
+            # 构建分类树；SQLite 不保证聚合函数的输入顺序，子分类在这里按名称排序
+            data = [
+                {
                     "name": main_cat,
                     "image": image,
-                    "sub_categories": []
+                    "sub_categories": sorted(json.loads(sub_categories), key=lambda sub: sub["name"] or "")
                 }
-            
-            # 只有当子分类名称不等于主分类名称时才添加
-            if sub_cat != main_cat:
-                categories[main_cat]["sub_categories"].append({
-                    "name": sub_cat,
-                    "alias": alias,
-                    "tid": tid
-                })
-        
-        # 打印结果
-        print("\n=== 分类数据 ===")
-        print(f"主分类数量: {len(categories)}")
-        for main_cat, data in categories.items():
-            print(f"{main_cat}: {len(data['sub_categories'])} 个子分类")
-        print("===============\n")
-        
-        return {
-            "status": "success",
-            "data": list(categories.values())
-        }
+                for main_cat, image, sub_categories in cursor
+            ]
+        body = json.dumps(
+            {"status": "success", "data": data},
+            ensure_ascii=False,
+            separators=(",", ":")
+        ).encode("utf-8")
+        _set_cached('categories', body)
+        return Response(content=body, media_type="application/json")
         
     except sqlite3.Error as e:
         error_msg = f"数据库错误: {str(e)}"
-        print(f"=== 错误 ===\n{error_msg}\n===========")
+        logger.error(error_msg)
         return {"status": "error", "message": error_msg}
-    finally:
-        if conn:
-            conn.close()
+
 
 @router.get("/main-categories", summary="获取所有主分类")
 async def get_main_categories():
     """获取所有主分类"""
+    cached = _get_cached('main')
+    if cached is not None:
+        return {"status": "success", "data": cached}
+
     try:
         # 确保表存在
         ensure_table_exists()
         
-        conn = get_db()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-        SELECT DISTINCT main_category, image 
-        FROM video_categories 
-        ORDER BY main_category
-        ''')
-        
-        categories = []
-        for row in cursor.fetchall():
-            categories.append({
-                "name": row[0],
-                "image": row[1]
-            })
+        with get_db() as conn:
+            cursor = conn.cursor()
+
+            cursor.execute('''
+            SELECT DISTINCT main_category, image 
+            FROM video_categories 
+            ORDER BY main_category
+            ''')
+            categories = [
+                {"name": row["main_category"], "image": row["image"]}
+                for row in cursor
+            ]
             
+        _set_cached('main', categories)
         return {
             "status": "success",
             "data": categories
@@ -136,35 +177,36 @@ async def get_main_categories():
         
     except sqlite3.Error as e:
         return {"status": "error", "message": f"数据库错误: {str(e)}"}
-    finally:
-        if conn:
-            conn.close()
+
 
 @router.get("/sub-categories/{main_category}", summary="获取指定主分类下的所有子分类")
 async def get_sub_categories(main_category: str):
     """获取指定主分类下的所有子分类"""
+    cached = _get_cached(('sub', main_category))
+    if cached is not None:
+        return {"status": "success", "data": cached}
+
     try:
         # 确保表存在
         ensure_table_exists()
         
-        conn = get_db()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-        SELECT sub_category, alias, tid 
-        FROM video_categories 
-        WHERE main_category = ? AND sub_category != main_category
-        ORDER BY sub_category
-        ''', (main_category,))
-        
-        categories = []
-        for row in cursor.fetchall():
-            categories.append({
-                "name": row[0],
-                "alias": row[1],
-                "tid": row[2]
-            })
+        with get_db() as conn:
+            cursor = conn.cursor()
+
+            cursor.execute('''
+            SELECT sub_category, alias, tid 
+            FROM video_categories 
+            WHERE main_category = ? AND sub_category != main_category
+            ORDER BY sub_category
+            ''', (main_category,))
+            categories = [
+                {"name": row["sub_category"], "alias": row["alias"], "tid": row["tid"]}
+                for row in cursor
+            ]
             
+        # 只缓存存在的主分类，避免任意路径参数撑大缓存
+        if categories:
+            _set_cached(('sub', main_category), categories)
         return {
             "status": "success",
             "data": categories
@@ -172,6 +214,3 @@ async def get_sub_categories(main_category: str):
         
     except sqlite3.Error as e:
         return {"status": "error", "message": f"数据库错误: {str(e)}"}
-    finally:
-        if conn:
-            conn.close() 
\ No newline at end of file
@@ -1,126 +1,213 @@
+import logging
 import sqlite3
+import time
 from datetime import datetime
+from functools import lru_cache
 from typing import Optional
 
 from fastapi import APIRouter, HTTPException, Query
 
-from scripts.utils import load_config, get_output_path
+from config.sql_statements_sqlite import CREATE_INDEX_DAILY
+from scripts.db_pool import borrow, on_reset
 
 router = APIRouter()
-config = load_config()
+logger = logging.getLogger(__name__)
+
+# 可用年份缓存: (缓存时间, 年份列表)，年份只在跨年或导入数据时变化
+YEARS_CACHE_TTL = 600
+_years_cache = None
+
+def _reset_years_cache():
+    global _years_cache
+    _years_cache = None
+
+# 重置数据库后年份表全部失效
+on_reset(_reset_years_cache)
 
 def get_db():
-    """获取数据库连接"""
-    db_path = get_output_path(config['db_file'])
-    return sqlite3.connect(db_path)
+    """从连接池借出数据库连接，需配合 with 使用"""
+    return borrow()
+
+@lru_cache(maxsize=4096)
+def _day_bounds(year: int, month: int, day: int):
+    """返回指定日期 00:00:00 与 23:59:59 的本地时间戳，日期无效时抛出 ValueError"""
+    start = datetime(year, month, day)
+    end = start.replace(hour=23, minute=59, second=59)
+    return int(start.timestamp()), int(end.timestamp())
+
+# 按天统计用到的 SQL 模板，{table} 只会被替换为经过校验的年份表名
+_DAILY_SQL = {
+    # 总体指标(k=0)、分区前5(k=1)、UP主前5(k=2) 合并为一条语句，一次执行一次取回
+    "stats": """
+        SELECT 0 AS k, COUNT(*) AS count,
+               COUNT(DISTINCT author_mid) AS unique_authors,
+               AVG(duration) AS avg_duration,
+               AVG(CAST(progress AS FLOAT) / CAST(duration AS FLOAT)) AS avg_completion_rate,
+               COUNT(CASE WHEN progress >= duration * 0.9 THEN 1 END) AS completed_videos,
+               NULL AS name
+        FROM {table}
+        WHERE view_at >= :start AND view_at <= :end
+        UNION ALL
+        SELECT 1, count, NULL, NULL, NULL, NULL, tag_name
+        FROM (
+            SELECT tag_name, COUNT(*) AS count
+            FROM {table}
+            WHERE view_at >= :start AND view_at <= :end
+            GROUP BY tag_name
+            ORDER BY count DESC
+            LIMIT 5
+        )
+        UNION ALL
+        SELECT 2, count, NULL, NULL, NULL, NULL, author_name
+        FROM (
+            SELECT author_name, COUNT(*) AS count
+            FROM {table}
+            WHERE view_at >= :start AND view_at <= :end
+            GROUP BY author_mid
+            ORDER BY count DESC
+            LIMIT 5
+        )
+        ORDER BY k, count DESC
+    """,
+    "business": """
+        SELECT 
+            business,
+            COUNT(*) as count
+        FROM {table}
+        WHERE view_at >= ? AND view_at < ?
+        GROUP BY business
+    """,
+}
 
-def get_available_years():
-    """获取数据库中所有可用的年份"""
-    conn = get_db()
+# (查询名, 年份) -> 格式化后的 SQL，同一文本在连接的语句缓存中复用，无需每次重新编译
+_stmt_cache = {}
+
+def get_daily_sql(query_id: str, year: int) -> str:
+    """获取指定年份表的统计 SQL，年份必须为整数"""
+    key = (query_id, year)
+    sql = _stmt_cache.get(key)
+    if sql is None:
+        if not isinstance(year, int):
+            raise ValueError(f"无效的年份: {year!r}")
+        sql = _DAILY_SQL[query_id].format(table=f"bilibili_history_{year}")
+        _stmt_cache[key] = sql
+    return sql
+
+def parse_date(date: str, year: int):
+    """解析MMDD格式日期，返回 (月, 日, 当天0点时间戳, 当天23:59:59时间戳)，格式无效时抛出 ValueError"""
+    month = int(date[:2])
+    day = int(date[2:])
+    start_timestamp, end_timestamp = _day_bounds(year, month, day)
+    return month, day, start_timestamp, end_timestamp
+
+def create_daily_indexes():
+    """为已有的年份表补建按天统计的覆盖索引，在应用启动时调用一次
+
+    新导入的年份表建表时已经包含该索引，这里只处理旧版本创建的表。
+    建索引需要写数据库，放在启动阶段执行，统计接口本身保持只读。
+    """
     try:
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT name FROM sqlite_master 
-            WHERE type='table' AND name LIKE 'bilibili_history_%'
-            ORDER BY name DESC
-        """)
-        
-        years = []
-        for (table_name,) in cursor.fetchall():
-            try:
-                year = int(table_name.split('_')[-1])
-                years.append(year)
-            except (ValueError, IndexError):
-                continue
-                
-        return sorted(years, reverse=True)
+        with get_db() as conn:
+            cursor = conn.cursor()
+            for year in _query_available_years(cursor):
+                cursor.execute(CREATE_INDEX_DAILY.format(table=f"bilibili_history_{year}"))
+            conn.commit()
+    except sqlite3.Error as e:
+        # 索引只影响查询速度，创建失败时统计接口仍可正常使用
+        logger.error("创建按天统计索引失败: %s", e)
+
+def _query_available_years(cursor):
+    """扫描 sqlite_master 获取所有年份表对应的年份"""
+    cursor.execute("""
+        SELECT name FROM sqlite_master 
+        WHERE type='table' AND name LIKE 'bilibili_history_%'
+        ORDER BY name DESC
+    """)
+
+    years = []
+    for (table_name,) in cursor:
+        try:
+            year = int(table_name.split('_')[-1])
+            years.append(year)
+        except (ValueError, IndexError):
+            continue
+
+    return sorted(years, reverse=True)
+
+def get_available_years(cursor=None, refresh: bool = False):
+    """获取数据库中所有可用的年份
+
+    结果缓存 YEARS_CACHE_TTL 秒；传入 cursor 时复用调用方已持有的连接
+    """
+    global _years_cache
+    if not refresh and _years_cache and time.monotonic() - _years_cache[0] < YEARS_CACHE_TTL:
+        return list(_years_cache[1])
+
+    try:
+        if cursor is not None:
+            years = _query_available_years(cursor)
+        else:
+            with get_db() as conn:
+                years = _query_available_years(conn.cursor())
     except sqlite3.Error as e:
-        print(f"获取年份列表时发生错误: {e}")
+        logger.error("获取年份列表时发生错误: %s", e)
         return []
-    finally:
-        if conn:
-            conn.close()
 
-def get_daily_video_count(cursor, table_name: str, date: str) -> dict:
+    _years_cache = (time.monotonic(), years)
+    return list(years)
+
+def get_daily_video_count(cursor, year: int, month: int, day: int,
+                          start_timestamp: int, end_timestamp: int) -> dict:
     """获取指定日期的视频数量统计
     
     Args:
         cursor: 数据库游标
-        table_name: 表名
-        date: 日期字符串，格式为MMDD
+        year: 年份
+        month: 月份
+        day: 日
+        start_timestamp: 当天0点时间戳
+        end_timestamp: 当天23:59:59时间戳（包含）
     
     Returns:
         dict: 包含视频数量统计的字典
     """
-    try:
-        # 解析日期
-        month = int(date[:2])
-        day = int(date[2:])
-        
-        # 从表名中获取年份
-        year = int(table_name.split('_')[-1])
-        
-        # 构建日期范围
-        start_timestamp = int(datetime(year, month, day, 0, 0, 0).timestamp())
-        end_timestamp = int(datetime(year, month, day, 23, 59, 59).timestamp())
-        
-        # 查询总视频数
-        cursor.execute(f"""
-            SELECT COUNT(*) as total_count,
-                   COUNT(DISTINCT author_mid) as unique_authors,
-                   AVG(duration) as avg_duration,
-                   AVG(CAST(progress AS FLOAT) / CAST(duration AS FLOAT)) as avg_completion_rate,
-                   COUNT(CASE WHEN progress >= duration * 0.9 THEN 1 END) as completed_videos
-            FROM {table_name}
-            WHERE view_at >= ? AND view_at <= ?
-        """, (start_timestamp, end_timestamp))
-        
-        result = cursor.fetchone()
-        total_count, unique_authors, avg_duration, avg_completion_rate, completed_videos = result
-        
-        # 查询分区分布
-        cursor.execute(f"""
-            SELECT tag_name, COUNT(*) as count
-            FROM {table_name}
-            WHERE view_at >= ? AND view_at <= ?
-            GROUP BY tag_name
-            ORDER BY count DESC
-            LIMIT 5
-        """, (start_timestamp, end_timestamp))
-        
-        tag_distribution = {row[0]: row[1] for row in cursor.fetchall()}
-        
-        # 查询UP主分布
-        cursor.execute(f"""
-            SELECT author_name, COUNT(*) as count
-            FROM {table_name}
-            WHERE view_at >= ? AND view_at <= ?
-            GROUP BY author_mid
-            ORDER BY count DESC
-            LIMIT 5
-        """, (start_timestamp, end_timestamp))
-        
-        author_distribution = {row[0]: row[1] for row in cursor.fetchall()}
-        
-        return {
-            "date": f"{year}-{month:02d}-{day:02d}",
-            "total_videos": total_count,
-            "unique_authors": unique_authors,
-            "avg_duration": round(avg_duration if avg_duration else 0, 2),
-            "avg_completion_rate": round(avg_completion_rate * 100 if avg_completion_rate else 0, 2),
-            "completed_videos": completed_videos,
-            "tag_distribution": tag_distribution,
-            "author_distribution": author_distribution,
-            "insights": [
-                f"这一天你一共观看了 {total_count} 个视频",
-                f"来自 {unique_authors} 个不同的UP主",
-                f"平均时长 {round(avg_duration/60 if avg_duration else 0, 1)} 分钟",
-                f"平均完成率 {round(avg_completion_rate * 100 if avg_completion_rate else 0, 1)}%",
-                f"完整看完 {completed_videos} 个视频"
-            ]
-        }
-    except ValueError as e:
-        raise HTTPException(status_code=400, detail=f"日期格式错误: {str(e)}")
+    total_count = unique_authors = completed_videos = 0
+    avg_duration = avg_completion_rate = None
+    tag_distribution = {}
+    author_distribution = {}
+
+    # 单条语句返回总体指标和两个分布，按 k 分发
+    cursor.execute(get_daily_sql("stats", year), {"start": start_timestamp, "end": end_timestamp})
+    for row in cursor:
+        k = row["k"]
+        if k == 0:
+            total_count = row["count"]
+            unique_authors = row["unique_authors"]
+            avg_duration = row["avg_duration"]
+            avg_completion_rate = row["avg_completion_rate"]
+            completed_videos = row["completed_videos"]
+        elif k == 1:
+            tag_distribution[row["name"]] = row["count"]
+        else:
+            author_distribution[row["name"]] = row["count"]
+
+    return {
+        "date": f"{year}-{month:02d}-{day:02d}",
+        "total_videos": total_count,
+        "unique_authors": unique_authors,
+        "avg_duration": round(avg_duration if avg_duration else 0, 2),
+        "avg_completion_rate": round(avg_completion_rate * 100 if avg_completion_rate else 0, 2),
+        "completed_videos": completed_videos,
+        "tag_distribution": tag_distribution,
+        "author_distribution": author_distribution,
+        "insights": [
+            f"这一天你一共观看了 {total_count} 个视频",
+            f"来自 {unique_authors} 个不同的UP主",
+            f"平均时长 {round(avg_duration/60 if avg_duration else 0, 1)} 分钟",
+            f"平均完成率 {round(avg_completion_rate * 100 if avg_completion_rate else 0, 1)}%",
+            f"完整看完 {completed_videos} 个视频"
+        ]
+    }
 
 @router.get("/daily-count", summary="获取指定日期的观看记录统计")
 async def get_daily_count(
@@ -140,47 +227,29 @@ async def get_daily_count(
             
         # 构建完整日期
         try:
-            month = int(date[:2])
-            day = int(date[2:])
-            target_date = datetime(year, month, day)
+            month, day, start_timestamp, _ = parse_date(date, year)
         except ValueError:
             return {
                 "status": "error",
                 "message": "日期格式无效，应为MMDD格式，例如0113表示1月13日"
             }
             
-        # 获取当日起止时间戳
-        start_timestamp = int(datetime(year, month, day).timestamp())
+        # 当日结束时间戳
         end_timestamp = start_timestamp + 86400  # 加一天的秒数
         
-        conn = get_db()
-        cursor = conn.cursor()
-        
-        # 检查年份表是否存在
-        table_name = f"bilibili_history_{year}"
-        cursor.execute("""
-            SELECT name FROM sqlite_master 
-            WHERE type='table' AND name=?
-        """, (table_name,))
-        
-        if not cursor.fetchone():
-            return {
-                "status": "error",
-                "message": f"未找到 {year} 年的历史记录数据"
-            }
-            
-        # 查询所有类型的条目数量
-        query = f"""
-            SELECT 
-                business,
-                COUNT(*) as count
-            FROM {table_name}
-            WHERE view_at >= ? AND view_at < ?
-            GROUP BY business
-        """
-        
-        cursor.execute(query, (start_timestamp, end_timestamp))
-        results = cursor.fetchall()
+        with get_db() as conn:
+            cursor = conn.cursor()
+
+            # 检查年份表是否存在，缓存中没有时再刷新一次，兼容新导入的年份
+            if year not in get_available_years(cursor) and year not in get_available_years(cursor, refresh=True):
+                return {
+                    "status": "error",
+                    "message": f"未找到 {year} 年的历史记录数据"
+                }
+
+            # 查询所有类型的条目数量
+            cursor.execute(get_daily_sql("business", year), (start_timestamp, end_timestamp))
+            results = cursor.fetchall()
         
         # 计算总数并按类型分类
         total_count = 0
@@ -195,7 +264,7 @@ async def get_daily_count(
         return {
             "status": "success",
             "data": {
-                "date": target_date.strftime("%Y-%m-%d"),
+                "date": f"{year}-{month:02d}-{day:02d}",
                 "total_count": total_count,
                 "type_counts": type_counts
             }
@@ -203,6 +272,43 @@ async def get_daily_count(
         
     except sqlite3.Error as e:
         return {"status": "error", "message": f"数据库错误: {str(e)}"}
-    finally:
-        if conn:
-            conn.close() 
\ No newline at end of file
+
+@router.get("/daily-count/stats", summary="获取指定日期的视频观看详细统计")
+async def get_daily_stats(
+    date: str = Query(..., description="日期，格式为MMDD，例如0113表示1月13日"),
+    year: Optional[int] = Query(None, description="年份，不传则使用当前年份")
+):
+    """获取指定日期的视频数量、UP主、时长、完成率及分区/UP主分布统计
+
+    Args:
+        date: 日期，格式为MMDD
+        year: 年份，不传则使用当前年份
+    """
+    if year is None:
+        year = datetime.now().year
+
+    try:
+        month, day, start_timestamp, end_timestamp = parse_date(date, year)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"日期格式错误: {str(e)}")
+
+    try:
+        with get_db() as conn:
+            cursor = conn.cursor()
+
+            if year not in get_available_years(cursor) and year not in get_available_years(cursor, refresh=True):
+                return {
+                    "status": "error",
+                    "message": f"未找到 {year} 年的历史记录数据"
+                }
+
+            stats = get_daily_video_count(cursor, year, month, day,
+                                          start_timestamp, end_timestamp)
+
+        return {
+            "status": "success",
+            "data": stats
+        }
+
+    except sqlite3.Error as e:
+        return {"status": "error", "message": f"数据库错误: {str(e)}"}
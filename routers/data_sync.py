@@ -1,18 +1,31 @@
+import asyncio
 import json
 import os
-import yaml
+import re
 from datetime import datetime
 from typing import Optional, List
 
+from filelock import FileLock
 from fastapi import APIRouter, BackgroundTasks, Query, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from pydantic import BaseModel
+from starlette.background import BackgroundTask
 
 from scripts.check_data_integrity import check_data_integrity
 from scripts.sync_db_json import sync_data
-from scripts.utils import load_config, get_output_path
+from scripts.utils import load_config, load_yaml_cached, get_config_path, get_output_path
 
 router = APIRouter()
 
+# 配置文件路径，模块加载时解析一次
+CONFIG_PATH = get_config_path('config.yaml')
+# 改写配置文件时使用的文件锁，放在 output 目录下，不在用户编辑和挂载的配置目录中留下文件
+CONFIG_LOCK_PATH = get_output_path('config.yaml.lock')
+
+# 确保检查结果输出目录存在（只在导入时创建一次）
+os.makedirs("output/check", exist_ok=True)
+
 class SyncedDayInfo(BaseModel):
     date: str
     imported_count: int
@@ -39,6 +52,7 @@ class CheckDataIntegrityResponse(BaseModel):
     result_file: str
     report_file: str
     timestamp: str
+    message: Optional[str] = None
 
 class IntegrityCheckConfigRequest(BaseModel):
     check_on_startup: bool
@@ -50,23 +64,20 @@ class IntegrityCheckConfigResponse(BaseModel):
 
 def run_sync_data(db_path: Optional[str] = None, json_root_path: Optional[str] = None):
     """在后台运行数据同步任务"""
-    # 确保输出目录存在
-    os.makedirs("output/check", exist_ok=True)
-
     # 调用同步函数
     result = sync_data(db_path, json_root_path)
     return result
 
 def run_check_integrity(db_path: Optional[str] = None, json_root_path: Optional[str] = None):
     """在后台运行数据完整性检查任务"""
-    # 确保输出目录存在
-    os.makedirs("output/check", exist_ok=True)
-
     # 调用检查函数
     result = check_data_integrity(db_path, json_root_path)
     return result
 
-@router.post("/sync", response_model=SyncDBJsonResponse, summary="同步数据库和JSON文件")
+# 同步/检查结果是内部生成的可信字典，synced_days 可能很大，不再逐字段做响应模型校验，
+# 模型只用于 OpenAPI 文档
+@router.post("/sync", response_model=None, responses={200: {"model": SyncDBJsonResponse}},
+             summary="同步数据库和JSON文件")
 async def sync_db_json(
     background_tasks: BackgroundTasks,
     db_path: Optional[str] = Query(None, description="数据库文件路径，默认为 output/bilibili_history.db"),
@@ -95,8 +106,8 @@ async def sync_db_json(
             "message": "同步任务已在后台启动，请稍后查看日志获取结果"
         }
     else:
-        # 同步模式下，直接执行并返回结果
-        result = run_sync_data(db_path, json_path)
+        # 同步模式下，在线程池中执行并等待结果，避免阻塞事件循环
+        result = await run_in_threadpool(run_sync_data, db_path, json_path)
 
         # 如果result不包含synced_days字段，添加一个空列表
         if "synced_days" not in result:
@@ -106,9 +117,10 @@ async def sync_db_json(
         if "timestamp" not in result:
             result["timestamp"] = datetime.now().isoformat()
 
-        return result
+        return JSONResponse(content=result)
 
-@router.post("/check", response_model=CheckDataIntegrityResponse, summary="检查数据完整性")
+@router.post("/check", response_model=None, responses={200: {"model": CheckDataIntegrityResponse}},
+             summary="检查数据完整性")
 async def check_integrity(
     background_tasks: BackgroundTasks,
     db_path: Optional[str] = Query(None, description="数据库文件路径，默认为 output/bilibili_history.db"),
@@ -127,7 +139,7 @@ async def check_integrity(
     """
     # 检查配置是否允许执行数据完整性校验
     if not force_check:
-        config = load_config()
+        config = load_config(readonly=True)
         check_enabled = config.get('server', {}).get('data_integrity', {}).get('check_on_startup', True)
         if not check_enabled:
             return {
@@ -161,78 +173,160 @@ async def check_integrity(
             "message": "数据完整性检查任务已在后台启动，请稍后查看报告文件获取结果"
         }
     else:
-        # 同步模式下，直接执行并返回结果
-        result = run_check_integrity(db_path, json_path)
-        return {
+        # 同步模式下，在线程池中执行并等待结果，避免阻塞事件循环
+        result = await run_in_threadpool(run_check_integrity, db_path, json_path)
+        return JSONResponse(content={
             **result,
             "timestamp": datetime.now().isoformat()
+        })
+
+REPORT_FILE = "output/check/data_integrity_report.md"
+
+def _check_report_exists():
+    """报告不存在时返回提示信息（配置禁用校验时）或抛出404，存在时返回 None"""
+    if os.path.exists(REPORT_FILE):
+        return None
+
+    # 如果报告文件不存在，检查是否是因为配置禁用了校验
+    config = load_config(readonly=True)
+    check_enabled = config.get('server', {}).get('data_integrity', {}).get('check_on_startup', True)
+    if not check_enabled:
+        return {
+            "message": "数据完整性校验已在配置中禁用，无法获取报告。如需查看报告，请先执行数据完整性检查。"
         }
+    raise HTTPException(status_code=404, detail="报告文件不存在，请先执行数据完整性检查")
 
 @router.get("/report", summary="获取最新的数据完整性报告")
 async def get_report():
     """
     获取最新的数据完整性检查报告的内容。
 
-    返回报告的内容和最后修改时间。
+    直接以 text/markdown 文件流返回报告内容，最后修改时间放在 X-Modified-Time 响应头中。
     """
-    # 检查配置是否允许执行数据完整性校验
-    config = load_config()
-    check_enabled = config.get('server', {}).get('data_integrity', {}).get('check_on_startup', True)
-
-    report_file = "output/check/data_integrity_report.md"
-
-    if not os.path.exists(report_file):
-        # 如果报告文件不存在，检查是否是因为配置禁用了校验
-        if not check_enabled:
-            return {
-                "message": "数据完整性校验已在配置中禁用，无法获取报告。如需查看报告，请先执行数据完整性检查。"
-            }
-        else:
-            raise HTTPException(status_code=404, detail="报告文件不存在，请先执行数据完整性检查")
+    message = _check_report_exists()
+    if message:
+        return message
 
     try:
-        with open(report_file, "r", encoding="utf-8") as f:
-            content = f.read()
+        mod_time_str = datetime.fromtimestamp(os.path.getmtime(REPORT_FILE)).isoformat()
+        return FileResponse(
+            REPORT_FILE,
+            media_type="text/markdown; charset=utf-8",
+            headers={"X-Modified-Time": mod_time_str}
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"读取报告文件时出错: {str(e)}")
 
-        # 获取文件修改时间
-        mod_time = os.path.getmtime(report_file)
-        mod_time_str = datetime.fromtimestamp(mod_time).isoformat()
+@router.get("/report/meta", summary="获取最新数据完整性报告的元信息")
+async def get_report_meta():
+    """
+    获取最新的数据完整性检查报告的元信息。
 
+    返回报告的最后修改时间、大小和文件路径，不包含报告内容。
+    """
+    message = _check_report_exists()
+    if message:
+        return message
+
+    try:
+        stat = os.stat(REPORT_FILE)
         return {
-            "content": content,
-            "modified_time": mod_time_str,
-            "file_path": report_file
+            "modified_time": datetime.fromtimestamp(stat.st_mtime).isoformat(),
+            "size": stat.st_size,
+            "file_path": REPORT_FILE
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"读取报告文件时出错: {str(e)}")
 
+SYNC_RESULT_FILE = "output/check/sync_result.json"
+_STREAM_CHUNK_SIZE = 64 * 1024
+
+# 同步结果文件开头部分的缓存: ((inode, 修改时间ns, 文件大小), 前导空白字节数, 开头内容)
+# 文件不超过一个块时开头内容即完整文件，轮询时无需再读磁盘
+_sync_head_cache = None
+
+def _open_sync_result():
+    """打开同步结果文件并读取、校验开头部分，文件未变化时开头部分直接使用缓存
+
+    开头部分和后续内容都从同一个文件描述符读取，按 fstat 结果缓存，
+    同步过程中结果文件被替换时也不会把新旧两个文件的内容拼在一起。
+
+    Returns:
+        (已打开的文件, os.stat_result, 前导空白字节数, 以 { 开头的内容)
+    """
+    global _sync_head_cache
+    f = open(SYNC_RESULT_FILE, "rb")
+    try:
+        st = os.fstat(f.fileno())
+        key = (st.st_ino, st.st_mtime_ns, st.st_size)
+        cached = _sync_head_cache
+        if cached and cached[0] == key:
+            return f, st, cached[1], cached[2]
+
+        # 只读取开头部分，确认文件内容是JSON对象
+        head = f.read(_STREAM_CHUNK_SIZE)
+        stripped = head.lstrip()
+        if not stripped.startswith(b'{'):
+            raise ValueError("同步结果文件不是JSON对象")
+
+        leading_ws = len(head) - len(stripped)
+        _sync_head_cache = (key, leading_ws, stripped)
+        return f, st, leading_ws, stripped
+    except BaseException:
+        f.close()
+        raise
+
+def _stream_json_with_field(f, leading_ws: int, head: bytes, total_size: int,
+                            field: str, value: str):
+    """流式输出JSON对象文件，并在对象开头插入一个字段，输出完成后关闭文件
+
+    leading_ws 为文件开头的空白字节数，head 为紧随其后已读取的内容（以 { 开头）
+    """
+    body = head[1:]
+    prefix = b'{' + json.dumps(field).encode("utf-8") + b':' + json.dumps(value).encode("utf-8")
+    # 原对象为空 {} 时不能补逗号
+    if body.lstrip().startswith(b'}'):
+        yield prefix
+    else:
+        yield prefix + b','
+    with f:
+        yield body
+
+        # 开头部分已包含完整文件时无需再读
+        if leading_ws + len(head) >= total_size:
+            return
+
+        f.seek(leading_ws + len(head))
+        while chunk := f.read(_STREAM_CHUNK_SIZE):
+            yield chunk
+
 @router.get("/sync/result", summary="获取最新的同步结果")
 async def get_sync_result():
     """
     获取最新的数据同步结果。
 
     返回同步的详细信息，包括每天同步的记录数量和记录标题。
+    结果文件以流的形式直接输出，不在内存中解析整个JSON。
     """
-    result_file = "output/check/sync_result.json"
-
-    if not os.path.exists(result_file):
-        raise HTTPException(status_code=404, detail="同步结果文件不存在，请先执行数据同步")
-
     try:
-        with open(result_file, "r", encoding="utf-8") as f:
-            result = json.load(f)
-
-        # 获取文件修改时间
-        mod_time = os.path.getmtime(result_file)
-        mod_time_str = datetime.fromtimestamp(mod_time).isoformat()
-
-        # 添加文件修改时间
-        result["file_modified_time"] = mod_time_str
-
-        return result
+        # 文件读取放到线程池中执行，避免阻塞事件循环
+        f, st, leading_ws, head = await run_in_threadpool(_open_sync_result)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="同步结果文件不存在，请先执行数据同步")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"读取同步结果文件时出错: {str(e)}")
 
+    # 获取文件修改时间
+    mod_time_str = datetime.fromtimestamp(st.st_mtime).isoformat()
+
+    return StreamingResponse(
+        _stream_json_with_field(f, leading_ws, head, st.st_size,
+                                "file_modified_time", mod_time_str),
+        media_type="application/json",
+        # 响应未开始输出就被中断时，生成器不会执行，由后台任务关闭文件
+        background=BackgroundTask(f.close)
+    )
+
 @router.get("/config", summary="获取数据完整性校验配置")
 async def get_integrity_check_config():
     """
@@ -242,7 +336,7 @@ async def get_integrity_check_config():
     """
     try:
         # 加载配置
-        config = load_config()
+        config = load_config(readonly=True)
 
         # 获取数据完整性校验配置
         check_on_startup = config.get('server', {}).get('data_integrity', {}).get('check_on_startup', True)
@@ -255,6 +349,84 @@ async def get_integrity_check_config():
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取数据完整性校验配置时出错: {str(e)}")
 
+# 配置文件逐行匹配用的正则（匹配去掉缩进后的行）
+_RE_SERVER = re.compile(r'^server\s*:')
+_RE_DATA_INTEGRITY = re.compile(r'^data_integrity\s*:')
+_RE_CHECK_ON_STARTUP = re.compile(r'^check_on_startup\s*:')
+
+def _set_check_on_startup(content: str, value: bool) -> str:
+    """在配置文件文本中设置 server.data_integrity.check_on_startup，单次遍历，保留其余内容和注释"""
+    lines = content.split('\n')
+    value_line = f"check_on_startup: {str(value).lower()}"
+    server_idx = None
+    data_integrity_idx = None
+
+    for i, line in enumerate(lines):
+        stripped = line.strip()
+        if not stripped or stripped.startswith('#'):
+            continue
+        indent = len(line) - len(line.lstrip())
+
+        if indent == 0:
+            if server_idx is not None:
+                break  # 已离开server段
+            if stripped.startswith('server') and _RE_SERVER.match(stripped):
+                server_idx = i
+        elif server_idx is None:
+            continue
+        elif indent == 2:
+            if data_integrity_idx is not None:
+                break  # 已离开data_integrity段
+            if stripped.startswith('data_integrity') and _RE_DATA_INTEGRITY.match(stripped):
+                data_integrity_idx = i
+        elif (data_integrity_idx is not None and indent == 4
+              and stripped.startswith('check_on_startup') and _RE_CHECK_ON_STARTUP.match(stripped)):
+            lines[i] = f"{line[:indent]}{value_line}"
+            return '\n'.join(lines)
+
+    # 没有找到check_on_startup配置，需要添加
+    if data_integrity_idx is not None:
+        lines.insert(data_integrity_idx + 1, f"    {value_line}")
+    elif server_idx is not None:
+        lines[server_idx + 1:server_idx + 1] = ["  data_integrity:", f"    {value_line}"]
+    else:
+        lines.extend(["server:", "  data_integrity:", f"    {value_line}"])
+    return '\n'.join(lines)
+
+def _atomic_write(config_path: str, content: str):
+    """先写临时文件并落盘，再替换原文件，读取方和崩溃后都不会看到写了一半的配置
+
+    文件修改时间和大小随之变化，load_config 的缓存会自动失效
+    """
+    tmp_path = config_path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(content)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, config_path)
+
+def _update_check_on_startup(config_path: str, value: bool):
+    """读改写配置文件中的 check_on_startup（阻塞操作，在线程池中执行）"""
+    # 文件锁防止其他进程同时改写配置
+    with FileLock(CONFIG_LOCK_PATH):
+        with open(config_path, 'r', encoding='utf-8') as f:
+            content = f.read()
+
+        _atomic_write(config_path, _set_check_on_startup(content, value))
+
+        # 只对写入后的新文件解析一次做校验，同时预热 load_config 的缓存
+        try:
+            new_config = load_yaml_cached(config_path)
+            valid = new_config['server']['data_integrity']['check_on_startup'] is value
+        except Exception:
+            valid = False
+        if not valid:
+            _atomic_write(config_path, content)
+            raise ValueError("更新后的配置文件校验失败，已恢复原配置")
+
+# 串行化本进程内的配置写入请求，避免并发更新互相覆盖
+_config_write_lock = asyncio.Lock()
+
 @router.post("/config", response_model=IntegrityCheckConfigResponse, summary="更新数据完整性校验配置")
 async def update_integrity_check_config(request: IntegrityCheckConfigRequest):
     """
@@ -265,68 +437,9 @@ async def update_integrity_check_config(request: IntegrityCheckConfigRequest):
     返回更新后的配置。
     """
     try:
-        # 获取配置文件路径
-        config_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "config", "config.yaml")
-
-        # 读取当前配置文件内容
-        with open(config_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-            config = yaml.safe_load(content)  # 仅用于获取当前配置和检查结构
-
-        # 确保server和data_integrity配置存在
-        if 'server' not in config:
-            config['server'] = {}
-        if 'data_integrity' not in config['server']:
-            config['server']['data_integrity'] = {}
-
-        # 使用正则表达式精确更新配置值
-        import re
-
-        # 检查是否已存在data_integrity配置
-        data_integrity_exists = False
-        server_exists = False
-        check_on_startup_exists = False
-
-        lines = content.split('\n')
-        for i, line in enumerate(lines):
-            if re.match(r'^\s*server\s*:', line):
-                server_exists = True
-            elif server_exists and re.match(r'^\s{2}data_integrity\s*:', line):
-                data_integrity_exists = True
-            elif data_integrity_exists and re.match(r'^\s{4}check_on_startup\s*:', line):
-                check_on_startup_exists = True
-                # 更新check_on_startup的值
-                indent = line[:line.find('check_on_startup')]
-                lines[i] = f"{indent}check_on_startup: {str(request.check_on_startup).lower()}"
-                break
-
-        # 如果没有找到check_on_startup配置，需要添加
-        if not check_on_startup_exists:
-            if data_integrity_exists:
-                # 找到data_integrity行，在其后添加check_on_startup
-                for i, line in enumerate(lines):
-                    if re.match(r'^\s{2}data_integrity\s*:', line):
-                        lines.insert(i + 1, f"    check_on_startup: {str(request.check_on_startup).lower()}")
-                        break
-            elif server_exists:
-                # 找到server行，在其后添加data_integrity和check_on_startup
-                for i, line in enumerate(lines):
-                    if re.match(r'^\s*server\s*:', line):
-                        lines.insert(i + 1, f"  data_integrity:")
-                        lines.insert(i + 2, f"    check_on_startup: {str(request.check_on_startup).lower()}")
-                        break
-            else:
-                # 如果没有server配置，在文件末尾添加
-                lines.append("server:")
-                lines.append("  data_integrity:")
-                lines.append(f"    check_on_startup: {str(request.check_on_startup).lower()}")
-
-        # 写回配置文件
-        with open(config_path, 'w', encoding='utf-8') as f:
-            f.write('\n'.join(lines))
-
-        # 更新内存中的配置
-        config['server']['data_integrity']['check_on_startup'] = request.check_on_startup
+        # 文件读写和fsync放到线程池，不阻塞事件循环
+        async with _config_write_lock:
+            await run_in_threadpool(_update_check_on_startup, CONFIG_PATH, request.check_on_startup)
 
         return IntegrityCheckConfigResponse(
             success=True,
@@ -334,4 +447,4 @@ async def update_integrity_check_config(request: IntegrityCheckConfigRequest):
             check_on_startup=request.check_on_startup
         )
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"更新数据完整性校验配置时出错: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"更新数据完整性校验配置时出错: {str(e)}")
@@ -3,6 +3,7 @@ DeepSeek API 路由
 提供与DeepSeek大语言模型交互的API接口
 """
 
+import asyncio
 import json
 import os
 import re
@@ -10,11 +11,12 @@ from datetime import datetime
 from typing import Optional, List
 
 import aiohttp
-import requests
-import yaml
 from fastapi import APIRouter, HTTPException, BackgroundTasks
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 
+from scripts.utils import get_config_path, load_config
+
 # 创建API路由
 router = APIRouter()
 
@@ -82,20 +84,11 @@ class ApiKeyStatusResponse(BaseModel):
     is_valid: bool = Field(..., description="API密钥是否有效")
     message: str = Field(..., description="状态描述信息")
 
-# 加载YAML配置文件
-def load_config():
-    """加载配置文件"""
-    config_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "config", "config.yaml")
-    try:
-        with open(config_path, 'r', encoding='utf-8') as f:
-            config = yaml.safe_load(f)
-        return config
-    except Exception as e:
-        print(f"加载配置文件出错: {e}")
-        return {}
+# 配置文件路径，模块加载时解析一次
+CONFIG_PATH = get_config_path('config.yaml')
 
-# 获取配置
-config = load_config()
+# 获取配置（只读，使用 scripts.utils 中带缓存的 load_config）
+config = load_config(readonly=True)
 deepseek_config = config.get('deepseek', {})
 
 # 设置API密钥（优先使用环境变量，其次使用配置文件）
@@ -104,6 +97,51 @@ API_BASE = deepseek_config.get('api_base', 'https://api.deepseek.com/v1')
 DEFAULT_MODEL = deepseek_config.get('default_model', 'deepseek-chat')
 SSL_VERIFY = deepseek_config.get('ssl_verify', False)  # 默认关闭SSL验证
 
+# 请求默认参数，模块加载时解析一次
+DEFAULT_SETTINGS = deepseek_config.get('default_settings', {})
+DEFAULT_TEMPERATURE = DEFAULT_SETTINGS.get("temperature", 1.0)
+DEFAULT_MAX_TOKENS = DEFAULT_SETTINGS.get("max_tokens", 1000)
+
+def _build_headers(api_key: str) -> dict:
+    return {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json"
+    }
+
+# 聊天接口使用的请求头，API密钥更新时重新生成
+HEADERS = _build_headers(API_KEY)
+
+# 聊天请求超时（秒）
+CHAT_TIMEOUT = aiohttp.ClientTimeout(total=120)
+
+# 共享的HTTP会话，复用连接池和TLS连接，避免每次请求重新握手
+_session: Optional[aiohttp.ClientSession] = None
+
+def get_session() -> aiohttp.ClientSession:
+    """获取共享的 aiohttp 会话，首次使用时创建"""
+    global _session
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(ssl=SSL_VERIFY))
+    return _session
+
+async def close_http_session():
+    """关闭共享的HTTP会话，在应用关闭时调用"""
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
+# 流式请求只限制单次读取的等待时间，不限制总时长
+STREAM_TIMEOUT = aiohttp.ClientTimeout(total=None, sock_read=120)
+
+_SSE_PREFIX = b"data: "
+_SSE_SUFFIX = b"\n\n"
+
+def _sse_event(content: str, finish_reason: Optional[str]) -> bytes:
+    """构造一条SSE数据帧"""
+    payload = json.dumps({'content': content, 'finish_reason': finish_reason}, separators=(",", ":"))
+    return _SSE_PREFIX + payload.encode('utf-8') + _SSE_SUFFIX
+
 # 辅助函数，用于记录API调用日志
 async def log_api_call(model: str, prompt_tokens: int, completion_tokens: int):
     """记录API调用日志，可以扩展为保存到数据库或发送到监控系统"""
@@ -247,20 +285,14 @@ async def chat_completion(
     # 准备API调用
     url = f"{API_BASE}/chat/completions"
     
-    headers = {
-        "Authorization": f"Bearer {API_KEY}",
-        "Content-Type": "application/json"
-    }
-    
-    # 从配置中获取默认设置
-    default_settings = deepseek_config.get('default_settings', {})
+    headers = HEADERS
     
     # 请求数据
     data = {
         "model": request.model or DEFAULT_MODEL,
-        "messages": [{"role": msg.role, "content": msg.content} for msg in request.messages],
-        "temperature": request.temperature if request.temperature is not None else default_settings.get("temperature", 1.0),
-        "max_tokens": request.max_tokens if request.max_tokens is not None else default_settings.get("max_tokens", 1000),
+        "messages": [msg.model_dump() for msg in request.messages],
+        "temperature": request.temperature if request.temperature is not None else DEFAULT_TEMPERATURE,
+        "max_tokens": request.max_tokens if request.max_tokens is not None else DEFAULT_MAX_TOKENS,
     }
     
     # 添加可选参数
@@ -277,11 +309,16 @@ async def chat_completion(
     
     try:
         # 发送请求
-        response = requests.post(url, headers=headers, json=data, verify=SSL_VERIFY)
-        response.raise_for_status()  # 抛出HTTP错误，如果有的话
-        
-        # 获取响应
-        result = response.json()
+        async with get_session().post(url, headers=headers, json=data, timeout=CHAT_TIMEOUT) as response:
+            if response.status != 200:
+                error_msg = await response.text()
+                raise HTTPException(
+                    status_code=500,
+                    detail=f"API调用出错: {response.status} {response.reason}\n错误详情: {error_msg}"
+                )
+
+            # 获取响应
+            result = await response.json()
         
         # 提取内容
         content = result.get("choices", [{}])[0].get("message", {}).get("content", "")
@@ -313,11 +350,10 @@ async def chat_completion(
             },
             "finish_reason": finish_reason
         }
-    except requests.exceptions.RequestException as e:
-        error_message = f"API调用出错: {str(e)}"
-        if hasattr(e, 'response') and e.response:
-            error_message += f"\n错误详情: {e.response.text}"
-        raise HTTPException(status_code=500, detail=error_message)
+    except aiohttp.ClientError as e:
+        raise HTTPException(status_code=500, detail=f"API调用出错: {str(e)}")
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=500, detail="API调用出错: 请求超时")
 
 @router.post("/stream")
 async def stream_completion(request: ChatRequest):
@@ -336,20 +372,14 @@ async def stream_completion(request: ChatRequest):
     # 准备API调用
     url = f"{API_BASE}/chat/completions"
     
-    headers = {
-        "Authorization": f"Bearer {API_KEY}",
-        "Content-Type": "application/json"
-    }
-    
-    # 从配置中获取默认设置
-    default_settings = deepseek_config.get('default_settings', {})
+    headers = HEADERS
     
     # 请求数据
     data = {
         "model": request.model or DEFAULT_MODEL,
-        "messages": [{"role": msg.role, "content": msg.content} for msg in request.messages],
-        "temperature": request.temperature if request.temperature is not None else default_settings.get("temperature", 1.0),
-        "max_tokens": request.max_tokens if request.max_tokens is not None else default_settings.get("max_tokens", 1000),
+        "messages": [msg.model_dump() for msg in request.messages],
+        "temperature": request.temperature if request.temperature is not None else DEFAULT_TEMPERATURE,
+        "max_tokens": request.max_tokens if request.max_tokens is not None else DEFAULT_MAX_TOKENS,
         "stream": True  # 启用流式输出
     }
     
@@ -361,40 +391,37 @@ async def stream_completion(request: ChatRequest):
     if request.json_mode:
         data["response_format"] = {"type": "json_object"}
     
-    try:
-        # 创建一个异步生成器函数处理流式响应
-        async def generate():
-            # 使用同步请求获取流式响应
-            with requests.post(url, headers=headers, json=data, stream=True, verify=SSL_VERIFY) as response:
-                response.raise_for_status()  # 抛出HTTP错误，如果有的话
-                
-                # 返回SSE格式的流式响应
-                for line in response.iter_lines():
-                    if line:
-                        line_str = line.decode('utf-8')
-                        # 处理SSE格式数据
-                        if line_str.startswith('data: '):
-                            data_str = line_str[6:]  # 跳过'data: '
-                            if data_str == '[DONE]':
-                                yield f"data: {json.dumps({'content': '', 'finish_reason': 'stop'})}\n\n"
-                                break
-                            try:
-                                data = json.loads(data_str)
-                                delta = data.get('choices', [{}])[0].get('delta', {})
-                                content = delta.get('content', '')
-                                finish_reason = data.get('choices', [{}])[0].get('finish_reason')
-                                yield f"data: {json.dumps({'content': content, 'finish_reason': finish_reason})}\n\n"
-                            except json.JSONDecodeError:
-                                yield f"data: {json.dumps({'content': '[解析错误]', 'finish_reason': None})}\n\n"
-        
-        # 返回流式响应
-        from fastapi.responses import StreamingResponse
-        return StreamingResponse(generate(), media_type="text/event-stream")
-    except requests.exceptions.RequestException as e:
-        error_message = f"API调用出错: {str(e)}"
-        if hasattr(e, 'response') and e.response:
-            error_message += f"\n错误详情: {e.response.text}"
-        raise HTTPException(status_code=500, detail=error_message)
+    # 创建一个异步生成器函数处理流式响应
+    async def generate():
+        try:
+            async with get_session().post(url, headers=headers, json=data, timeout=STREAM_TIMEOUT) as response:
+                if response.status != 200:
+                    error_msg = await response.text()
+                    yield _sse_event(f"[API调用出错: {response.status} {error_msg}]", "error")
+                    return
+
+                # 逐行读取SSE数据，不阻塞事件循环
+                async for raw_line in response.content:
+                    line = raw_line.strip()
+                    # 处理SSE格式数据
+                    if not line.startswith(b'data: '):
+                        continue
+                    data_str = line[6:]  # 跳过'data: '
+                    if data_str == b'[DONE]':
+                        yield _sse_event('', 'stop')
+                        break
+                    try:
+                        chunk = json.loads(data_str)
+                        choice = chunk.get('choices', [{}])[0]
+                        content = choice.get('delta', {}).get('content', '')
+                        yield _sse_event(content, choice.get('finish_reason'))
+                    except json.JSONDecodeError:
+                        yield _sse_event('[解析错误]', None)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            yield _sse_event(f"[API调用出错: {str(e) or type(e).__name__}]", "error")
+
+    # 返回流式响应
+    return StreamingResponse(generate(), media_type="text/event-stream")
 
 @router.get("/models", response_model=ModelList, summary="列出可用的DeepSeek模型")
 async def list_models():
@@ -411,34 +438,34 @@ async def list_models():
             
         api_base = config.get('deepseek', {}).get('api_base', 'https://api.deepseek.com/v1')
         
-        async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(ssl=SSL_VERIFY)) as session:
-            async with session.get(
-                f"{api_base}/models",
-                headers={
-                    "Authorization": f"Bearer {api_key}",
-                    "Content-Type": "application/json"
-                }
-            ) as response:
-                if response.status != 200:
-                    error_msg = await response.text()
-                    raise HTTPException(
-                        status_code=response.status,
-                        detail=f"DeepSeek API请求失败: {error_msg}"
-                    )
-                    
-                data = await response.json()
-                return ModelList(
-                    object="list",
-                    data=[
-                        ModelInfo(
-                            id=model["id"],
-                            object=model.get("object", "model"),
-                            owned_by=model.get("owned_by", "deepseek")
-                        )
-                        for model in data.get("data", [])
-                    ]
+        session = get_session()
+        async with session.get(
+            f"{api_base}/models",
+            headers={
+                "Authorization": f"Bearer {api_key}",
+                "Content-Type": "application/json"
+            }
+        ) as response:
+            if response.status != 200:
+                error_msg = await response.text()
+                raise HTTPException(
+                    status_code=response.status,
+                    detail=f"DeepSeek API请求失败: {error_msg}"
                 )
                 
+            data = await response.json()
+            return ModelList(
+                object="list",
+                data=[
+                    ModelInfo(
+                        id=model["id"],
+                        object=model.get("object", "model"),
+                        owned_by=model.get("owned_by", "deepseek")
+                    )
+                    for model in data.get("data", [])
+                ]
+            )
+            
     except aiohttp.ClientError as e:
         raise HTTPException(
             status_code=500,
@@ -468,35 +495,35 @@ async def get_user_balance():
         # 构造余额查询URL
         balance_url = f"{api_base}/user/balance"
         
-        async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(ssl=SSL_VERIFY)) as session:
-            async with session.get(
-                balance_url,
-                headers={
-                    "Authorization": f"Bearer {api_key}",
-                    "Content-Type": "application/json"
-                }
-            ) as response:
-                if response.status != 200:
-                    error_msg = await response.text()
-                    raise HTTPException(
-                        status_code=response.status,
-                        detail=f"DeepSeek API请求失败: {error_msg}"
-                    )
-                    
-                data = await response.json()
-                return BalanceResponse(
-                    is_available=data.get("is_available", False),
-                    balance_infos=[
-                        BalanceInfo(
-                            currency=balance_info.get("currency", ""),
-                            total_balance=balance_info.get("total_balance", "0.00"),
-                            granted_balance=balance_info.get("granted_balance", "0.00"),
-                            topped_up_balance=balance_info.get("topped_up_balance", "0.00")
-                        )
-                        for balance_info in data.get("balance_infos", [])
-                    ]
+        session = get_session()
+        async with session.get(
+            balance_url,
+            headers={
+                "Authorization": f"Bearer {api_key}",
+                "Content-Type": "application/json"
+            }
+        ) as response:
+            if response.status != 200:
+                error_msg = await response.text()
+                raise HTTPException(
+                    status_code=response.status,
+                    detail=f"DeepSeek API请求失败: {error_msg}"
                 )
                 
+            data = await response.json()
+            return BalanceResponse(
+                is_available=data.get("is_available", False),
+                balance_infos=[
+                    BalanceInfo(
+                        currency=balance_info.get("currency", ""),
+                        total_balance=balance_info.get("total_balance", "0.00"),
+                        granted_balance=balance_info.get("granted_balance", "0.00"),
+                        topped_up_balance=balance_info.get("topped_up_balance", "0.00")
+                    )
+                    for balance_info in data.get("balance_infos", [])
+                ]
+            )
+            
     except aiohttp.ClientError as e:
         raise HTTPException(
             status_code=500,
@@ -531,38 +558,38 @@ async def check_api_key():
         api_base = config.get('deepseek', {}).get('api_base', 'https://api.deepseek.com/v1')
         test_url = f"{api_base}/models"  # 使用模型列表API来测试
         
-        async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(ssl=SSL_VERIFY)) as session:
-            async with session.get(
-                test_url,
-                headers={
-                    "Authorization": f"Bearer {api_key}",
-                    "Content-Type": "application/json"
-                }
-            ) as response:
-                if response.status != 200:
-                    error_msg = await response.text()
-                    try:
-                        # 解析错误信息
-                        error_data = json.loads(error_msg)
-                        if "error" in error_data and "message" in error_data["error"]:
-                            error_msg = error_data["error"]["message"]
-                    except:
-                        # 解析错误信息失败，使用原始错误信息
-                        pass
-                    
-                    return ApiKeyStatusResponse(
-                        is_set=True,
-                        is_valid=False,
-                        message=f"API密钥无效: {error_msg}"
-                    )
+        session = get_session()
+        async with session.get(
+            test_url,
+            headers={
+                "Authorization": f"Bearer {api_key}",
+                "Content-Type": "application/json"
+            }
+        ) as response:
+            if response.status != 200:
+                error_msg = await response.text()
+                try:
+                    # 解析错误信息
+                    error_data = json.loads(error_msg)
+                    if "error" in error_data and "message" in error_data["error"]:
+                        error_msg = error_data["error"]["message"]
+                except:
+                    # 解析错误信息失败，使用原始错误信息
+                    pass
                 
-                # API密钥有效
                 return ApiKeyStatusResponse(
                     is_set=True,
-                    is_valid=True,
-                    message="API密钥有效"
+                    is_valid=False,
+                    message=f"API密钥无效: {error_msg}"
                 )
             
+            # API密钥有效
+            return ApiKeyStatusResponse(
+                is_set=True,
+                is_valid=True,
+                message="API密钥有效"
+            )
+        
     except aiohttp.ClientError as e:
         return ApiKeyStatusResponse(
             is_set=True,
@@ -585,43 +612,43 @@ async def set_api_key(request: ApiKeyRequest):
     Returns:
         操作结果消息
     """
-    global API_KEY, config
+    global API_KEY, HEADERS, config
     
     try:
         # 验证API密钥是否有效
         api_base = config.get('deepseek', {}).get('api_base', 'https://api.deepseek.com/v1')
         test_url = f"{api_base}/models"  # 使用模型列表API来测试
         
-        async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(ssl=SSL_VERIFY)) as session:
-            async with session.get(
-                test_url,
-                headers={
-                    "Authorization": f"Bearer {request.api_key}",
-                    "Content-Type": "application/json"
-                }
-            ) as response:
-                if response.status != 200:
-                    error_msg = await response.text()
-                    try:
-                        # 解析错误信息
-                        error_data = json.loads(error_msg)
-                        if "error" in error_data and "message" in error_data["error"]:
-                            error_msg = error_data["error"]["message"]
-                    except:
-                        # 解析错误信息失败，使用原始错误信息
-                        pass
-                    
-                    return ApiKeyResponse(
-                        success=False,
-                        message=f"API密钥无效: {error_msg}"
-                    )
-        
+        session = get_session()
+        async with session.get(
+            test_url,
+            headers={
+                "Authorization": f"Bearer {request.api_key}",
+                "Content-Type": "application/json"
+            }
+        ) as response:
+            if response.status != 200:
+                error_msg = await response.text()
+                try:
+                    # 解析错误信息
+                    error_data = json.loads(error_msg)
+                    if "error" in error_data and "message" in error_data["error"]:
+                        error_msg = error_data["error"]["message"]
+                except:
+                    # 解析错误信息失败，使用原始错误信息
+                    pass
+                
+                return ApiKeyResponse(
+                    success=False,
+                    message=f"API密钥无效: {error_msg}"
+                )
+
         # API密钥有效，更新全局变量
         API_KEY = request.api_key
+        HEADERS = _build_headers(API_KEY)
         
         # 保存到配置文件
-        # 获取配置文件路径
-        config_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "config", "config.yaml")
+        config_path = CONFIG_PATH
         
         try:
             # 读取配置文件
@@ -636,7 +663,7 @@ async def set_api_key(request: ApiKeyRequest):
                 f.write(updated_content)
             
             # 更新全局配置
-            config = load_config()
+            config = load_config(readonly=True)
             
             return ApiKeyResponse(
                 success=True,
@@ -1,11 +1,16 @@
 import json
 import sqlite3
+import threading
+import time
+from collections import defaultdict
+from contextlib import closing
 from datetime import datetime
 from typing import List
 
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 
+from scripts.db_pool import on_reset
 from scripts.utils import load_config, get_output_path
 
 router = APIRouter()
@@ -16,9 +21,61 @@ class DeleteHistoryItem(BaseModel):
     view_at: int  # 观看时间戳
 
 def get_db():
-    """获取数据库连接"""
-    db_path = get_output_path(config['db_file'])
-    return sqlite3.connect(db_path)
+    """打开数据库连接，需配合 with 使用，退出时关闭
+
+    删除是写操作，每次请求单独打开连接，总是写入当前的数据库文件，不使用连接池中长期持有的连接
+    """
+    return closing(sqlite3.connect(get_output_path(config['db_file'])))
+
+# 年份表名缓存: (表名集合, 缓存时间)，新年份表每年最多出现一次
+TABLES_CACHE_TTL = 300
+_tables_cache = None
+_tables_lock = threading.Lock()
+
+def get_history_tables(cursor, refresh: bool = False) -> frozenset:
+    """获取所有 bilibili_history_% 年份表名，结果缓存 TABLES_CACHE_TTL 秒"""
+    global _tables_cache
+    with _tables_lock:
+        if (not refresh and _tables_cache is not None
+                and time.monotonic() - _tables_cache[1] < TABLES_CACHE_TTL):
+            return _tables_cache[0]
+
+        cursor.execute("""
+            SELECT name FROM sqlite_master
+            WHERE type='table' AND name LIKE 'bilibili_history_%'
+        """)
+        tables = frozenset(table[0] for table in cursor.fetchall())
+        _tables_cache = (tables, time.monotonic())
+        return tables
+
+def _reset_tables_cache():
+    global _tables_cache
+    with _tables_lock:
+        _tables_cache = None
+
+# 重置数据库后年份表全部失效
+on_reset(_reset_tables_cache)
+
+# 单条SQL中绑定参数数量上限（兼容旧版SQLite的999限制）
+_MAX_SQL_VARIABLES = 900
+
+def _find_existing_records(cursor, table_name: str, records: list) -> list:
+    """在年份表中查出实际存在的 (bvid, view_at) 记录，按 view_at 分批走索引查询"""
+    wanted = set(records)
+    view_ats = list({view_at for _, view_at in records})
+    existing = set()
+    for i in range(0, len(view_ats), _MAX_SQL_VARIABLES):
+        chunk = view_ats[i:i + _MAX_SQL_VARIABLES]
+        placeholders = ",".join("?" * len(chunk))
+        cursor.execute(
+            f"SELECT bvid, view_at FROM {table_name} WHERE view_at IN ({placeholders})",
+            chunk
+        )
+        existing.update(
+            record for record in ((row[0], row[1]) for row in cursor.fetchall())
+            if record in wanted
+        )
+    return [record for record in records if record in existing]
 
 def update_last_import_time(timestamp: int):
     """更新最后导入时间记录"""
@@ -28,9 +85,11 @@ def update_last_import_time(timestamp: int):
         "last_import_date": datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d")
     }
 
+    # 一次编码为字节并一次性写入，避免 json.dump 逐段写文件
+    data = json.dumps(record, ensure_ascii=False, indent=4).encode('utf-8')
     record_file = get_output_path('last_import.json')
-    with open(record_file, 'w', encoding='utf-8') as f:
-        json.dump(record, f, ensure_ascii=False, indent=4)
+    with open(record_file, 'wb') as f:
+        f.write(data)
 
 @router.delete("/batch-delete", summary="批量删除历史记录")
 async def batch_delete_history(items: List[DeleteHistoryItem]):
@@ -46,71 +105,72 @@ async def batch_delete_history(items: List[DeleteHistoryItem]):
         raise HTTPException(status_code=400, detail="请提供要删除的视频记录列表")
 
     try:
-        conn = get_db()
-        cursor = conn.cursor()
+        # 外层在结束时关闭连接，内层 conn 作为事务：成功时提交，出错时回滚
+        with get_db() as conn, conn:
+            cursor = conn.cursor()
+
+            # 获取当前所有年份的表
+            tables = get_history_tables(cursor)
+
+            # 确保删除记录表存在
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS deleted_history (
+                    id INTEGER PRIMARY KEY,
+                    bvid TEXT NOT NULL,
+                    view_at INTEGER NOT NULL,
+                    delete_time INTEGER NOT NULL,
+                    UNIQUE(bvid, view_at)
+                )
+            """)
+
+            # 获取当前时间戳作为删除时间
+            current_time = int(datetime.now().timestamp())
+
+            # 按年份分组（同时去重），每个年份表只需一次查询和一次批量删除
+            buckets = defaultdict(list)
+            for record in dict.fromkeys((item.bvid, item.view_at) for item in items):
+                buckets[time.localtime(record[1]).tm_year].append(record)
+
+            # 缓存中缺少请求涉及的年份时刷新一次，兼容新创建的年份表
+            if any(f"bilibili_history_{year}" not in tables for year in buckets):
+                tables = get_history_tables(cursor, refresh=True)
+
+            deleted_records = []
+            for year, records in buckets.items():
+                table_name = f"bilibili_history_{year}"
+                if table_name not in tables:
+                    continue
+
+                existing = _find_existing_records(cursor, table_name, records)
+                if not existing:
+                    continue
 
-        # 获取当前所有年份的表
-        cursor.execute("""
-            SELECT name FROM sqlite_master
-            WHERE type='table' AND name LIKE 'bilibili_history_%'
-        """)
-        tables = [table[0] for table in cursor.fetchall()]
-
-        total_deleted = 0
-        deleted_details = []
-        min_timestamp = float('inf')  # 记录最早的删除时间
-
-        # 确保删除记录表存在
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS deleted_history (
-                id INTEGER PRIMARY KEY,
-                bvid TEXT NOT NULL,
-                view_at INTEGER NOT NULL,
-                delete_time INTEGER NOT NULL,
-                UNIQUE(bvid, view_at)
-            )
-        """)
-
-        # 获取当前时间戳作为删除时间
-        current_time = int(datetime.now().timestamp())
-
-        for item in items:
-            # 从时间戳获取年份
-            year = datetime.fromtimestamp(item.view_at).year
-            table_name = f"bilibili_history_{year}"
-
-            if table_name in tables:
                 # 在对应年份的表中删除指定的记录
-                query = f"""
+                cursor.executemany(f"""
                     DELETE FROM {table_name}
                     WHERE bvid = ? AND view_at = ?
-                """
-                cursor.execute(query, (item.bvid, item.view_at))
-                if cursor.rowcount > 0:
-                    total_deleted += cursor.rowcount
-                    deleted_details.append({
-                        "bvid": item.bvid,
-                        "view_at": item.view_at,
-                        "view_time": datetime.fromtimestamp(item.view_at).strftime("%Y-%m-%d %H:%M:%S")
-                    })
-                    # 更新最早的删除时间
-                    min_timestamp = min(min_timestamp, item.view_at)
-
-                    # 将删除的记录添加到删除记录表中
-                    try:
-                        cursor.execute("""
-                            INSERT INTO deleted_history (bvid, view_at, delete_time)
-                            VALUES (?, ?, ?)
-                        """, (item.bvid, item.view_at, current_time))
-                    except sqlite3.IntegrityError:
-                        # 如果记录已存在，则更新删除时间
-                        cursor.execute("""
-                            UPDATE deleted_history
-                            SET delete_time = ?
-                            WHERE bvid = ? AND view_at = ?
-                        """, (current_time, item.bvid, item.view_at))
-
-        conn.commit()
+                """, existing)
+
+                # 将删除的记录添加到删除记录表中，已存在则更新删除时间
+                cursor.executemany("""
+                    INSERT INTO deleted_history (bvid, view_at, delete_time)
+                    VALUES (?, ?, ?)
+                    ON CONFLICT(bvid, view_at) DO UPDATE SET delete_time = excluded.delete_time
+                """, [(bvid, view_at, current_time) for bvid, view_at in existing])
+
+                deleted_records.extend(existing)
+
+        total_deleted = len(deleted_records)
+        deleted_details = [
+            {
+                "bvid": bvid,
+                "view_at": view_at,
+                "view_time": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(view_at))
+            }
+            for bvid, view_at in deleted_records
+        ]
+        # 记录最早的删除时间
+        min_timestamp = min((view_at for _, view_at in deleted_records), default=float('inf'))
 
         # 如果有记录被删除，更新last_import.json
         if total_deleted > 0 and min_timestamp != float('inf'):
@@ -130,6 +190,3 @@ async def batch_delete_history(items: List[DeleteHistoryItem]):
             status_code=500,
             detail=f"数据库操作失败: {str(e)}"
         )
-    finally:
-        if 'conn' in locals() and conn:
-            conn.close()
\ No newline at end of file
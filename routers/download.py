@@ -1,9 +1,19 @@
 import asyncio
+import codecs
+import hashlib
+import heapq
+import logging
 import os
+import platform
 import re
+import site
 import subprocess
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
 from datetime import datetime
+from functools import lru_cache
 from typing import Optional, List
 
 import requests
@@ -25,9 +35,21 @@ except ImportError:
     _process_record = None
     print("无法从 history 模块导入_process_image_url、get_video_by_cid 和_process_record 函数")
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 config = load_config()
 
+# 日期时间提取用的正则，模块加载时编译一次
+_RE_YMD_HMS = re.compile(r'(\d{4})(\d{2})(\d{2})_(\d{2})(\d{2})(\d{2})')
+_RE_YMD_HM = re.compile(r'(\d{4})(\d{2})(\d{2})_(\d{2})(\d{2})')
+_RE_YMD = re.compile(r'(\d{4})(\d{2})(\d{2})')
+
+# NFO 文件中提取作者 mid 与 BV 号用的正则
+_RE_MID = re.compile(r"space\.bilibili\.com/(\d+)")
+_RE_BVID = re.compile(r"video/(BV\w+)")
+
+@lru_cache(maxsize=4096)
 def extract_datetime_from_string(text):
     """
     从字符串中提取日期时间
@@ -44,48 +66,432 @@ def extract_datetime_from_string(text):
     Returns:
         格式化的日期时间字符串或 None
     """
-    # 调试信息
-    print(f"【时间提取】尝试从'{text}'中提取日期时间")
-
     # 尝试匹配 YYYYMMDD_HHMMSS 格式
-    match1 = re.match(r'.*?(\d{4})(\d{2})(\d{2})_(\d{2})(\d{2})(\d{2}).*', text)
+    match1 = _RE_YMD_HMS.search(text)
     if match1:
         year, month, day, hour, minute, second = match1.groups()
         result = f"{year}-{month}-{day} {hour}:{minute}:{second}"
-        print(f"【时间提取】匹配 YYYYMMDD_HHMMSS 格式：{result}")
         return result
 
     # 尝试匹配 YYYYMMDD_HHMM 格式
-    match2 = re.match(r'.*?(\d{4})(\d{2})(\d{2})_(\d{2})(\d{2}).*', text)
+    match2 = _RE_YMD_HM.search(text)
     if match2:
         year, month, day, hour, minute = match2.groups()
         result = f"{year}-{month}-{day} {hour}:{minute}:00"
-        print(f"【时间提取】匹配 YYYYMMDD_HHMM 格式：{result}")
         return result
 
     # 尝试匹配纯 YYYYMMDD 格式
-    match3 = re.match(r'.*?(\d{4})(\d{2})(\d{2}).*', text)
+    match3 = _RE_YMD.search(text)
     if match3:
         year, month, day = match3.groups()
         result = f"{year}-{month}-{day} 00:00:00"
-        print(f"【时间提取】匹配 YYYYMMDD 格式：{result}")
         return result
 
-    # 尝试匹配 Unix 时间戳（最后 10 位数字）
-    match4 = re.match(r'^(\d{10})$', text)
-    if match4:
+    # 尝试匹配 Unix 时间戳（10 位数字），长度和字符判断即可，不需要正则
+    if len(text) == 10 and text.isdecimal():
         try:
-            timestamp = int(match4.group(1))
+            timestamp = int(text)
             dt = datetime.fromtimestamp(timestamp)
             result = dt.strftime("%Y-%m-%d %H:%M:%S")
-            print(f"【时间提取】匹配 Unix 时间戳：{result}")
             return result
         except:
             pass
 
-    print(f"【时间提取】未能从'{text}'中提取日期时间")
     return None
 
+# 视频和音频文件扩展名，用 name[name.rfind('.'):] 切出扩展名后查集合，
+# 没有 "." 的文件名切出的是最后一个字符，不会误匹配
+_MEDIA_EXTS = frozenset({'.mp4', '.flv', '.m4a', '.mp3'})
+_AUDIO_EXTS = frozenset({'.m4a', '.mp3'})
+# 扩展名 -> 媒体类型
+_MEDIA_TYPES = {
+    '.mp4': 'video/mp4',
+    '.flv': 'video/x-flv',
+    '.m4a': 'audio/mp4',
+    '.mp3': 'audio/mpeg'
+}
+
+def _list_dir(top):
+    """列出单个目录，返回 (dirs, files) 两个 os.DirEntry 列表，目录不可读时返回 None"""
+    try:
+        with os.scandir(top) as it:
+            entries = list(it)
+    except OSError:
+        return None
+
+    dirs = []
+    files = []
+    for entry in entries:
+        try:
+            is_dir = entry.is_dir()
+        except OSError:
+            is_dir = False
+        (dirs if is_dir else files).append(entry)
+    return dirs, files
+
+def _scan_tree(top):
+    """
+    与 os.walk 相同的自顶向下遍历（不跟随目录符号链接），但返回 os.DirEntry，
+    文件的 stat 结果由 DirEntry 缓存，取大小和时间时不再逐项调用 getsize/getctime/getmtime
+
+    Yields:
+        (dirpath, dirs, files)：dirs 和 files 均为 os.DirEntry 列表，原地修改 dirs 可以剪枝
+    """
+    listing = _list_dir(top)
+    if listing is None:
+        return
+    dirs, files = listing
+
+    yield top, dirs, files
+
+    for entry in dirs:
+        if not entry.is_symlink():
+            yield from _scan_tree(entry.path)
+
+# 目录名中 "_" 后面的连续数字
+_RE_UNDERSCORE_DIGITS = re.compile(r'_(\d+)')
+
+def _match_cids(name, cid_by_str):
+    """
+    找出名称中以 "_<cid>" 形式出现的 CID，与逐个判断 f"_{cid}" in name 结果相同，
+    但只扫描一遍名称，耗时与待查 CID 的数量无关
+
+    Args:
+        name: 目录名
+        cid_by_str: CID 字符串到 CID 的映射
+    """
+    matched = []
+    for m in _RE_UNDERSCORE_DIGITS.finditer(name):
+        digits = m.group(1)
+        # f"_{cid}" 是子串匹配，"_" 后数字串的每个前缀都可能是 CID
+        for end in range(1, len(digits) + 1):
+            cid = cid_by_str.get(digits[:end])
+            if cid is not None and cid not in matched:
+                matched.append(cid)
+    return matched
+
+def _read_bytes(path):
+    """读取整个文件的字节内容（阻塞操作，在线程中执行）"""
+    with open(path, 'rb') as f:
+        return f.read()
+
+# 系统信息在进程生命周期内不会变化，模块加载时读取一次
+_PLATFORM = {
+    "system": platform.system(),
+    "release": platform.release(),
+    "platform": platform.platform()
+}
+
+def _os_info():
+    """返回给前端的系统信息"""
+    return {
+        "system": _PLATFORM["system"].lower(),
+        "release": _PLATFORM["release"],
+        "platform": _PLATFORM["platform"]
+    }
+
+# FFmpeg 安装指南，按系统/发行版预先拼好
+_INSTALL_GUIDE_HEADER = "请按照以下步骤安装 FFmpeg:\n\n"
+_INSTALL_GUIDES = {
+    "darwin": _INSTALL_GUIDE_HEADER + (
+        "macOS 安装步骤:\n\n"
+        "1. 使用 Homebrew 安装:\n"
+        "brew install ffmpeg\n\n"
+        "如果没有安装 Homebrew，请先安装 Homebrew:\n"
+        '/bin/bash -c "$(curl -fsSL https://raw.githubusercontent.com/Homebrew/install/HEAD/install.sh)"'
+    ),
+    "centos": _INSTALL_GUIDE_HEADER + (
+        "CentOS 7 安装步骤:\n\n"
+        "1. 安装 EPEL 仓库:\n"
+        "yum install -y epel-release\n\n"
+        "2. 安装 RPM Fusion 仓库:\n"
+        "yum localinstall -y --nogpgcheck https://download1.rpmfusion.org/free/el/rpmfusion-free-release-7.noarch.rpm\n\n"
+        "3. 安装 FFmpeg:\n"
+        "yum install -y ffmpeg ffmpeg-devel"
+    ),
+    "debian": _INSTALL_GUIDE_HEADER + (
+        "Ubuntu/Debian 安装步骤:\n"
+        "1. 更新包列表:\n"
+        "apt-get update\n\n"
+        "2. 安装 FFmpeg:\n"
+        "apt-get install -y ffmpeg"
+    ),
+    "linux": _INSTALL_GUIDE_HEADER + (
+        "未能识别的 Linux 发行版，请访问 FFmpeg 官网获取安装指南：\n"
+        "https://ffmpeg.org/download.html"
+    ),
+    "windows": _INSTALL_GUIDE_HEADER + (
+        "Windows 安装步骤:\n\n"
+        "1. 使用 Scoop 安装 (推荐):\n"
+        "scoop install ffmpeg\n\n"
+        "如果没有安装 Scoop，请先安装 Scoop:\n"
+        "Set-ExecutionPolicy RemoteSigned -Scope CurrentUser\n"
+        "irm get.scoop.sh | iex\n\n"
+        "2. 或者访问 FFmpeg 官网下载可执行文件:\n"
+        "https://ffmpeg.org/download.html#build-windows"
+    ),
+    "unknown": _INSTALL_GUIDE_HEADER + (
+        "未能识别的操作系统，请访问 FFmpeg 官网获取安装指南：\n"
+        "https://ffmpeg.org/download.html"
+    ),
+}
+
+@lru_cache(maxsize=1)
+def _detect_distro():
+    """
+    识别系统/发行版，返回 _INSTALL_GUIDES 的键，/etc/os-release 只读取一次
+
+    Returns:
+        darwin | centos | debian | linux | windows | unknown
+    """
+    system = _PLATFORM["system"].lower()
+    if system in ("darwin", "windows"):
+        return system
+    if system != "linux":
+        return "unknown"
+
+    os_release = ""
+    try:
+        if os.path.exists('/etc/os-release'):
+            with open('/etc/os-release', 'r') as f:
+                os_release = f.read().lower()
+    except Exception as e:
+        print(f"读取/etc/os-release 失败：{str(e)}")
+
+    if os.path.exists('/etc/centos-release') or 'centos' in os_release:
+        return "centos"
+    if os.path.exists('/etc/debian_version') or 'ubuntu' in os_release or 'debian' in os_release:
+        return "debian"
+    return "linux"
+
+# 目录可写检查结果的缓存时间（秒）
+WRITABLE_CACHE_TTL = 60
+# 路径 -> 可写检查的过期时间，只缓存可写的结果，权限修复后下次请求即可生效
+_writable_cache = {}
+
+def _is_writable(path):
+    """检查目录是否可写，结果缓存 WRITABLE_CACHE_TTL 秒"""
+    now = time.monotonic()
+    expires_at = _writable_cache.get(path)
+    if expires_at is not None and now < expires_at:
+        return True
+    if os.access(path, os.W_OK):
+        _writable_cache[path] = now + WRITABLE_CACHE_TTL
+        return True
+    _writable_cache.pop(path, None)
+    return False
+
+# 遍历下载目录用的线程池，多个子目录的 scandir/stat 并发提交，同时不阻塞事件循环
+_scan_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="download-scan")
+
+def _prefetch_stats(files):
+    """预取媒体文件和元数据文件的 stat，结果由 DirEntry 缓存"""
+    for entry in files:
+        name = entry.name
+        if name[name.rfind('.'):] in _MEDIA_EXTS or name == "metadata.json":
+            try:
+                entry.stat()
+            except OSError:
+                pass
+
+def _scan_subtree(top, prune=None):
+    """
+    遍历一棵子树并预取媒体文件和元数据文件的 stat（在线程池中执行）
+
+    Args:
+        top: 子树根目录
+        prune: 可选，prune(dirpath) 为真时不再进入该目录的子目录，且只为这些目录预取 stat
+    """
+    result = []
+    for dirpath, dirs, files in _scan_tree(top):
+        if prune is None:
+            _prefetch_stats(files)
+            result.append((dirpath, dirs, files))
+        elif prune(dirpath):
+            _prefetch_stats(files)
+            result.append((dirpath, dirs[:], files))
+            # 原地清空，_scan_tree 不再进入其子目录
+            dirs.clear()
+        else:
+            result.append((dirpath, dirs, files))
+    return result
+
+async def _scan_tree_parallel(top, prune=None):
+    """
+    按顶层子目录把 _scan_tree 分发到线程池并发执行
+
+    Args:
+        top: 遍历的根目录
+        prune: 可选，prune(dirpath) 为真时不再进入该目录的子目录，在各线程中调用
+
+    Returns:
+        与 _scan_tree 顺序相同的 (dirpath, dirs, files) 列表；遍历已完成，修改 dirs 不再起剪枝作用
+    """
+    loop = asyncio.get_running_loop()
+    listing = await loop.run_in_executor(_scan_pool, _list_dir, top)
+    if listing is None:
+        return []
+    dirs, files = listing
+    if prune is not None and prune(top):
+        return [(top, dirs, files)]
+
+    subtrees = await asyncio.gather(*(
+        loop.run_in_executor(_scan_pool, _scan_subtree, entry.path, prune)
+        for entry in dirs if not entry.is_symlink()
+    ))
+
+    result = [(top, dirs, files)]
+    for subtree in subtrees:
+        result.extend(subtree)
+    return result
+
+def _resolve_site_packages():
+    """解析当前 Python 环境实际存在的 site-packages 目录（PYTHONPATH 不会展开通配符）"""
+    try:
+        paths = site.getsitepackages()
+    except AttributeError:
+        # 部分打包环境中的 site 模块没有 getsitepackages
+        paths = []
+    return os.pathsep.join(p for p in paths if os.path.isdir(p))
+
+# 传给 yutto 子进程的 site-packages 路径，模块加载时解析一次
+_SITE_PACKAGES = _resolve_site_packages()
+
+# 打包环境下找到的 yutto.exe 路径，找到后不再逐个探测候选路径
+_frozen_yutto_path = None
+
+def _get_yutto_path():
+    """获取 yutto 可执行文件路径"""
+    global _frozen_yutto_path
+    if not getattr(sys, 'frozen', False):
+        # 如果是直接运行 python 脚本
+        return 'yutto'
+
+    # 缓存的路径仍然存在时直接使用（一次 stat），被删除或移动后重新查找
+    if _frozen_yutto_path is not None and os.path.exists(_frozen_yutto_path):
+        return _frozen_yutto_path
+    _frozen_yutto_path = None
+
+    # 如果是打包后的 exe 运行
+    base_path = os.path.dirname(sys.executable)
+    paths_to_try = [
+        os.path.join(base_path, 'yutto.exe'),  # 尝试主目录
+        os.path.join(base_path, '_internal', 'yutto.exe'),  # 尝试 _internal 目录
+        os.path.join(os.getcwd(), 'yutto.exe'),  # 尝试当前工作目录
+        os.path.join(os.getcwd(), '_internal', 'yutto.exe')  # 尝试当前工作目录的 _internal
+    ]
+
+    for path in paths_to_try:
+        if os.path.exists(path):
+            print(f"找到 yutto.exe: {path}")
+            _frozen_yutto_path = path
+            return path
+
+    raise FileNotFoundError(f"找不到 yutto.exe，已尝试的路径：{', '.join(paths_to_try)}")
+
+# which/where ffmpeg 和 ffmpeg -version 的成功结果，FFmpeg 安装后在进程生命周期内不会变化
+_ffmpeg_probe = None
+_ffmpeg_version_probe = None
+
+def _which_ffmpeg():
+    """执行 which ffmpeg（Windows 上为 where ffmpeg），只缓存成功结果，未安装时下次请求会重新检查"""
+    global _ffmpeg_probe
+    if _ffmpeg_probe is not None:
+        return _ffmpeg_probe
+    command = ['where', 'ffmpeg'] if sys.platform == 'win32' else ['which', 'ffmpeg']
+    result = subprocess.run(command, capture_output=True, text=True)
+    if result.returncode == 0:
+        _ffmpeg_probe = result
+    return result
+
+def _ffmpeg_version():
+    """执行 ffmpeg -version，只缓存成功结果"""
+    global _ffmpeg_version_probe
+    if _ffmpeg_version_probe is not None:
+        return _ffmpeg_version_probe
+    result = subprocess.run(['ffmpeg', '-version'], capture_output=True, text=True)
+    if result.returncode == 0:
+        _ffmpeg_version_probe = result
+    return result
+
+@lru_cache(maxsize=1)
+def _yutto_version():
+    """yutto --version 的输出，只用于调试日志，缓存后不再每次请求都启动子进程"""
+    return subprocess.run(['yutto', '--version'], capture_output=True, text=True)
+
+# 验证 SESSDATA 用的共享 HTTP 客户端，复用连接，在应用关闭时关闭
+_http = httpx.AsyncClient(
+    timeout=10.0,
+    headers={
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    }
+)
+
+async def close_http_client():
+    """关闭共享的HTTP客户端"""
+    await _http.aclose()
+
+# SESSDATA 验证结果的缓存时间（秒）
+SESSDATA_CACHE_TTL = 300
+# SESSDATA 摘要 -> (是否有效, 过期时间)，不在内存中保存明文 SESSDATA
+# 只缓存验证通过的结果：验证失败可能只是接口临时出错或限流，重新登录后也应立即生效
+_sessdata_cache = {}
+# 每个 SESSDATA 一把锁，缓存失效时并发请求只发起一次验证
+_sessdata_locks = {}
+
+async def _is_sessdata_valid(sessdata: str) -> bool:
+    """验证 SESSDATA 是否有效，有效的结果缓存 SESSDATA_CACHE_TTL 秒"""
+    key = hashlib.blake2b(sessdata.encode(), digest_size=16).hexdigest()
+    cached = _sessdata_cache.get(key)
+    if cached is not None and time.monotonic() < cached[1]:
+        return cached[0]
+
+    async with _sessdata_locks.setdefault(key, asyncio.Lock()):
+        # 等锁期间可能已有其他请求完成了验证
+        cached = _sessdata_cache.get(key)
+        now = time.monotonic()
+        if cached is not None and now < cached[1]:
+            return cached[0]
+
+        try:
+            valid = await _request_sessdata_valid(sessdata)
+        except HTTPException:
+            _sessdata_locks.pop(key, None)
+            raise
+
+        now = time.monotonic()
+        # 顺带清理过期的缓存项
+        for expired in [k for k, (_, expires_at) in _sessdata_cache.items() if expires_at <= now]:
+            del _sessdata_cache[expired]
+            _sessdata_locks.pop(expired, None)
+        if valid:
+            _sessdata_cache[key] = (valid, now + SESSDATA_CACHE_TTL)
+        else:
+            _sessdata_locks.pop(key, None)
+        return valid
+
+async def _request_sessdata_valid(sessdata: str) -> bool:
+    """请求 nav 接口验证 SESSDATA 是否有效，接口不可用时抛出 502"""
+    try:
+        response = await _http.get(
+            'https://api.bilibili.com/x/web-interface/nav',
+            headers={'Cookie': f'SESSDATA={sessdata}'}
+        )
+        data = response.json()
+    except httpx.HTTPError as e:
+        logger.error(f"请求 B 站登录状态接口失败：{str(e)}")
+        raise HTTPException(
+            status_code=502,
+            detail=f"验证登录状态失败：无法连接 B 站接口（{type(e).__name__}）"
+        )
+    except ValueError:
+        logger.error(f"B 站登录状态接口返回了非 JSON 响应，状态码：{response.status_code}")
+        raise HTTPException(
+            status_code=502,
+            detail="验证登录状态失败：B 站接口返回了无效的响应"
+        )
+    return isinstance(data, dict) and data.get('code') == 0
+
 class DownloadRequest(BaseModel):
     url: str
     sessdata: Optional[str] = Field(None, description="用户的 SESSDATA")
@@ -166,61 +572,118 @@ class FavoriteDownloadRequest(BaseModel):
     cover_only: Optional[bool] = Field(False, description="是否仅生成视频封面")
     no_chapter_info: Optional[bool] = Field(False, description="是否不生成章节信息")
 
-async def stream_process_output(process: subprocess.Popen):
+# 子进程输出的换行符，与文本模式 Popen 的通用换行一致，进度条用 \r 刷新的行也会逐行推送
+_RE_NEWLINE = re.compile(r'\r\n|\r|\n')
+
+async def _iter_lines(stream: asyncio.StreamReader):
+    """在事件循环中按行读取子进程输出，按 UTF-8 解码，无法解码的字节用替换字符代替"""
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    buffer = ''
+    while True:
+        chunk = await stream.read(65536)
+        if not chunk:
+            break
+        buffer += decoder.decode(chunk)
+        lines = _RE_NEWLINE.split(buffer)
+        # 最后一段可能是不完整的行，留到下次拼接
+        buffer = lines.pop()
+        for line in lines:
+            yield line
+    buffer += decoder.decode(b'', final=True)
+    if buffer:
+        yield buffer
+
+async def _spawn_yutto(command: List[str], env: dict) -> asyncio.subprocess.Process:
+    """以 asyncio 子进程启动 yutto，输出直接由事件循环读取，不再占用线程池"""
+    kwargs = {}
+    # 在 Windows 系统上添加 CREATE_NO_WINDOW 标志
+    if sys.platform == 'win32':
+        kwargs['creationflags'] = getattr(subprocess, 'CREATE_NO_WINDOW', 0)
+    return await asyncio.create_subprocess_exec(
+        *command,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        env=env,
+        **kwargs
+    )
+
+# SSE 响应头：禁止浏览器和反向代理（如 nginx）缓存或缓冲，每行下载进度立即送达
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no"
+}
+
+# 下载失败时汇总的错误输出行数上限
+STDERR_TAIL_LINES = 200
+
+async def stream_process_output(process: asyncio.subprocess.Process):
     """实时流式输出进程的输出"""
+    # stdout 和 stderr 同时读取，避免子进程写满 stderr 管道缓冲区后与这里互相等待
+    queue = asyncio.Queue(maxsize=256)
+    # 边转发边保留最近的错误输出，失败时直接汇总，管道无法回读
+    stderr_lines = deque(maxlen=STDERR_TAIL_LINES)
+
+    async def pump(stream: asyncio.StreamReader, prefix: str, buffer: Optional[deque] = None):
+        try:
+            async for line in _iter_lines(stream):
+                line = line.strip()
+                if line:
+                    if buffer is not None:
+                        buffer.append(line)
+                    await queue.put(f"data: {prefix}{line}\n\n")
+        except asyncio.CancelledError:
+            # 被取消说明消费方已停止读取，队列可能已满，不再发送结束标记以免在这里永久阻塞
+            raise
+        except Exception:
+            # 消费方仍在读取，发送结束标记后由 gather 抛出异常
+            await queue.put(None)
+            raise
+        # 通知消费方该输出流已结束
+        await queue.put(None)
+
+    tasks = [
+        asyncio.create_task(pump(process.stdout, "")),
+        asyncio.create_task(pump(process.stderr, "ERROR: ", stderr_lines))
+    ]
     try:
-        # 创建异步迭代器来读取输出
-        async def read_output():
-            while True:
-                line = await asyncio.get_event_loop().run_in_executor(None, process.stdout.readline)
-                if not line:
-                    break
-                yield line.strip()
-
-        # 实时读取并发送标准输出
-        async for line in read_output():
-            if line:
-                yield f"data: {line}\n\n"
-                # 立即刷新输出
-                await asyncio.sleep(0)
-
-        # 等待进程完成
-        return_code = await asyncio.get_event_loop().run_in_executor(None, process.wait)
-
-        # 读取可能的错误输出
-        stderr_output = await asyncio.get_event_loop().run_in_executor(None, process.stderr.read)
-        if stderr_output:
-            # 将错误输出按行分割并发送
-            for line in stderr_output.strip().split('\n'):
-                yield f"data: ERROR: {line}\n\n"
-                await asyncio.sleep(0)
+        # 实时发送标准输出和错误输出
+        remaining = len(tasks)
+        while remaining:
+            message = await queue.get()
+            if message is None:
+                remaining -= 1
+                continue
+            yield message
+
+        # 两个读取任务的异常在这里抛出，并等待进程完成
+        _, _, return_code = await asyncio.gather(*tasks, process.wait())
 
         # 发送完成事件
         if return_code == 0:
             yield "data: 下载完成\n\n"
         else:
-            # 如果有错误码，发送更详细的错误信息
             yield f"data: 下载失败，错误码：{return_code}\n\n"
-            # 尝试获取更多错误信息
-            try:
-                if process.stderr:
-                    process.stderr.seek(0)
-                    full_error = process.stderr.read()
-                    if full_error:
-                        yield f"data: 完整错误信息:\n{full_error}\n\n"
-            except Exception as e:
-                yield f"data: 无法获取完整错误信息：{str(e)}\n\n"
+            if stderr_lines:
+                # SSE 的多行数据每行都需要 data: 前缀
+                yield "data: 完整错误信息:\ndata: " + "\ndata: ".join(stderr_lines) + "\n\n"
 
     except Exception as e:
         yield f"data: 处理过程出错：{str(e)}\n\n"
         import traceback
         yield f"data: 错误堆栈:\n{traceback.format_exc()}\n\n"
     finally:
-        # 确保进程已结束
-        if process.poll() is None:
+        # 客户端断开时这里由 aclose() 触发，finally 中不能再 yield，只负责清理
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+        # 先结束进程再等待读取任务，读取任务即使卡住也不会让 yutto 进程残留
+        if process.returncode is None:
             process.terminate()
-            await asyncio.get_event_loop().run_in_executor(None, process.wait)
-        yield "event: close\ndata: close\n\n"
+            await process.wait()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    # 只在正常结束时发送关闭事件
+    yield "event: close\ndata: close\n\n"
 
 @router.post("/download_video", summary="下载 B 站视频")
 async def download_video(request: DownloadRequest):
@@ -240,53 +703,15 @@ async def download_video(request: DownloadRequest):
                     detail="未登录：当前设置要求必须登录才能下载视频"
                 )
 
-            # 验证 SESSDATA 是否有效
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-                'Cookie': f'SESSDATA={sessdata}'
-            }
-
-            response = requests.get(
-                'https://api.bilibili.com/x/web-interface/nav',
-                headers=headers,
-                timeout=10
-            )
-
-            data = response.json()
-            if data.get('code') != 0:
+            # 验证 SESSDATA 是否有效（异步请求，不阻塞事件循环）
+            if not await _is_sessdata_valid(sessdata):
                 raise HTTPException(
                     status_code=401,
                     detail="登录已失效：请重新登录"
                 )
 
         # 获取 yutto 可执行文件路径
-        if getattr(sys, 'frozen', False):
-            # 如果是打包后的 exe 运行
-            base_path = os.path.dirname(sys.executable)
-            paths_to_try = [
-                os.path.join(base_path, 'yutto.exe'),  # 尝试主目录
-                os.path.join(base_path, '_internal', 'yutto.exe'),  # 尝试 _internal 目录
-                os.path.join(os.getcwd(), 'yutto.exe'),  # 尝试当前工作目录
-                os.path.join(os.getcwd(), '_internal', 'yutto.exe')  # 尝试当前工作目录的 _internal
-            ]
-
-            yutto_path = None
-            for path in paths_to_try:
-                print(f"尝试路径：{path}")
-                if os.path.exists(path):
-                    yutto_path = path
-                    print(f"找到 yutto.exe: {path}")
-                    break
-
-            if yutto_path is None:
-                raise FileNotFoundError(f"找不到 yutto.exe，已尝试的路径：{', '.join(paths_to_try)}")
-        else:
-            # 如果是直接运行 python 脚本
-            yutto_path = 'yutto'
-            print(f"使用命令：{yutto_path}")
-
-        if not os.path.exists(yutto_path) and getattr(sys, 'frozen', False):
-            raise FileNotFoundError(f"找不到 yutto.exe，已尝试的路径：{yutto_path}")
+        yutto_path = _get_yutto_path()
 
         # 构建命令
         # 确保下载目录和临时目录存在且有正确的权限
@@ -298,12 +723,12 @@ async def download_video(request: DownloadRequest):
         os.makedirs(tmp_dir, exist_ok=True)
 
         # 检查目录权限
-        if not os.access(download_dir, os.W_OK):
+        if not _is_writable(download_dir):
             raise HTTPException(
                 status_code=500,
                 detail=f"没有下载目录的写入权限：{download_dir}"
             )
-        if not os.access(tmp_dir, os.W_OK):
+        if not _is_writable(tmp_dir):
             raise HTTPException(
                 status_code=500,
                 detail=f"没有临时目录的写入权限：{tmp_dir}"
@@ -414,74 +839,23 @@ async def download_video(request: DownloadRequest):
         # 在 Linux 上确保 PATH 包含 python 环境
         if sys.platform != 'win32':
             env['PATH'] = f"{os.path.dirname(sys.executable)}:{env.get('PATH', '')}"
-            # 添加 virtualenv 的 site-packages 路径（如果存在）
-            site_packages = os.path.join(os.path.dirname(os.path.dirname(sys.executable)), 'lib', 'python*/site-packages')
-            env['PYTHONPATH'] = f"{site_packages}:{env.get('PYTHONPATH', '')}"
-
-        # 准备进程参数
-        popen_kwargs = {
-            'stdout': subprocess.PIPE,
-            'stderr': subprocess.PIPE,
-            'encoding': 'utf-8',
-            'errors': 'replace',
-            'universal_newlines': True,
-            'env': env,
-            'bufsize': 1,  # 行缓冲
-            'shell': sys.platform != 'win32'  # 在非 Windows 系统上使用 shell
-        }
-
-        # 在 Windows 系统上添加 CREATE_NO_WINDOW 标志
-        if sys.platform == 'win32':
-            popen_kwargs['creationflags'] = subprocess.CREATE_NO_WINDOW if hasattr(subprocess, 'CREATE_NO_WINDOW') else 0
-            popen_kwargs['shell'] = False  # Windows 上不使用 shell
-
-        # 在 Linux 上将命令列表转换为字符串，同时处理特殊字符
-        command_str = None
-        if sys.platform != 'win32':
-            command_str = ' '.join(f"'{arg}'" if ((' ' in arg) or ("'" in arg) or ('"' in arg)) else arg for arg in command)
+            # 添加当前 Python 环境的 site-packages 路径（如果存在）
+            env['PYTHONPATH'] = os.pathsep.join(filter(None, [_SITE_PACKAGES, env.get('PYTHONPATH', '')]))
 
         try:
             # 执行命令，使用流式输出
             if sys.platform != 'win32':
                 # 检查 FFmpeg 是否安装
                 try:
-                    ffmpeg_process = subprocess.run(['which', 'ffmpeg'], capture_output=True, text=True)
+                    ffmpeg_process = await asyncio.to_thread(_which_ffmpeg)
                     if ffmpeg_process.returncode != 0:
                         print("FFmpeg 未安装，需要手动安装...")
                         print(f"which ffmpeg 返回值：{ffmpeg_process.returncode}")
                         print(f"which ffmpeg 输出：{ffmpeg_process.stdout}")
                         print(f"which ffmpeg 错误：{ffmpeg_process.stderr}")
 
-                        # 检测系统类型
-                        os_release = ""
-                        try:
-                            with open('/etc/os-release', 'r') as f:
-                                os_release = f.read().lower()
-                        except Exception as e:
-                            print(f"读取/etc/os-release 失败：{str(e)}")
-
-                        # 准备安装指南
-                        install_guide = "请按照以下步骤安装 FFmpeg:\n\n"
-
-                        if os.path.exists('/etc/centos-release') or 'centos' in os_release:
-                            install_guide += "CentOS 7 安装步骤:\n\n"
-                            install_guide += "1. 安装 EPEL 仓库:\n"
-                            install_guide += "yum install -y epel-release\n\n"
-                            install_guide += "2. 安装 RPM Fusion 仓库:\n"
-                            install_guide += "yum localinstall -y --nogpgcheck https://download1.rpmfusion.org/free/el/rpmfusion-free-release-7.noarch.rpm\n\n"
-                            install_guide += "3. 安装 FFmpeg:\n"
-                            install_guide += "yum install -y ffmpeg ffmpeg-devel"
-
-                        elif os.path.exists('/etc/debian_version') or 'ubuntu' in os_release or 'debian' in os_release:
-                            install_guide += "Ubuntu/Debian 安装步骤:\n"
-                            install_guide += "1. 更新包列表:\n"
-                            install_guide += "apt-get update\n\n"
-                            install_guide += "2. 安装 FFmpeg:\n"
-                            install_guide += "apt-get install -y ffmpeg"
-
-                        else:
-                            install_guide += "未能识别的 Linux 发行版，请访问 FFmpeg 官网获取安装指南：\n"
-                            install_guide += "https://ffmpeg.org/download.html"
+                        # 根据系统类型选择安装指南
+                        install_guide = _INSTALL_GUIDES[await asyncio.to_thread(_detect_distro)]
 
                         raise HTTPException(
                             status_code=500,
@@ -494,7 +868,7 @@ async def download_video(request: DownloadRequest):
                     )
 
                 print(f"\n=== 执行命令 ===")
-                print(f"命令：{command_str}")
+                print(f"命令：{' '.join(command)}")
                 print(f"工作目录：{os.getcwd()}")
                 print(f"yutto 路径：{yutto_path}")
                 print(f"yutto 是否存在：{os.path.exists(yutto_path)}")
@@ -505,7 +879,7 @@ async def download_video(request: DownloadRequest):
 
                 # 检查 yutto 命令
                 try:
-                    version_process = subprocess.run(['yutto', '--version'], capture_output=True, text=True)
+                    version_process = await asyncio.to_thread(_yutto_version)
                     print(f"\nyutto 版本信息：")
                     print(version_process.stdout)
                     if version_process.stderr:
@@ -513,35 +887,27 @@ async def download_video(request: DownloadRequest):
                 except Exception as e:
                     print(f"检查 yutto 版本失败：{str(e)}")
 
-                process = subprocess.Popen(
-                    command_str,
-                    **popen_kwargs
-                )
-            else:
-                process = subprocess.Popen(
-                    command,
-                    **popen_kwargs
-                )
+            process = await _spawn_yutto(command, env)
 
             # 返回 SSE 响应
             return StreamingResponse(
                 stream_process_output(process),
-                media_type="text/event-stream"
+                media_type="text/event-stream",
+                headers=SSE_HEADERS
             )
         except Exception as e:
             # 记录详细的错误信息
             error_msg = f"命令执行失败：{str(e)}\n"
-            error_msg += f"命令：{command if sys.platform == 'win32' else (command_str if command_str else ' '.join(command))}\n"
+            error_msg += f"命令：{' '.join(command)}\n"
             error_msg += f"环境变量:\n"
             error_msg += f"PATH: {env.get('PATH')}\n"
             error_msg += f"PYTHONPATH: {env.get('PYTHONPATH')}\n"
-            error_msg += f"下载目录：{download_dir} (可写：{os.access(download_dir, os.W_OK)})\n"
-            error_msg += f"临时目录：{tmp_dir} (可写：{os.access(tmp_dir, os.W_OK)})"
+            error_msg += f"下载目录：{download_dir} (可写：{_is_writable(download_dir)})\n"
+            error_msg += f"临时目录：{tmp_dir} (可写：{_is_writable(tmp_dir)})"
 
             # 添加系统信息
-            import platform
             error_msg += f"\n\n系统信息:\n"
-            error_msg += f"操作系统：{platform.system()} {platform.release()}\n"
+            error_msg += f"操作系统：{_PLATFORM['system']} {_PLATFORM['release']}\n"
             error_msg += f"Python 版本：{sys.version}\n"
             error_msg += f"工作目录：{os.getcwd()}\n"
             error_msg += f"yutto 路径：{yutto_path}\n"
@@ -550,13 +916,13 @@ async def download_video(request: DownloadRequest):
 
             # 添加 FFmpeg 信息
             try:
-                ffmpeg_process = subprocess.run(['which', 'ffmpeg'], capture_output=True, text=True)
+                ffmpeg_process = await asyncio.to_thread(_which_ffmpeg)
                 error_msg += f"\n\nFFmpeg 信息:\n"
                 if ffmpeg_process.returncode == 0:
                     ffmpeg_path = ffmpeg_process.stdout.strip()
                     error_msg += f"FFmpeg 路径：{ffmpeg_path}\n"
                     # 获取 FFmpeg 版本
-                    version_process = subprocess.run(['ffmpeg', '-version'], capture_output=True, text=True)
+                    version_process = await asyncio.to_thread(_ffmpeg_version)
                     if version_process.returncode == 0:
                         error_msg += f"FFmpeg 版本：{version_process.stdout.splitlines()[0]}\n"
             except Exception as ffmpeg_error:
@@ -567,6 +933,8 @@ async def download_video(request: DownloadRequest):
                 detail=error_msg
             )
 
+    except HTTPException:
+        raise
     except FileNotFoundError:
         raise HTTPException(
             status_code=500,
@@ -589,31 +957,14 @@ async def check_ffmpeg():
     """
     try:
         # 获取系统信息
-        import platform
-        system = platform.system().lower()
-        release = platform.release()
-        os_info = {
-            "system": system,
-            "release": release,
-            "platform": platform.platform()
-        }
+        os_info = _os_info()
 
-        # 根据不同系统使用不同的命令检查 FFmpeg
-        if system == 'windows':
-            ffmpeg_check_cmd = 'where ffmpeg'
-        else:
-            ffmpeg_check_cmd = 'which ffmpeg'
-
-        # 检查 FFmpeg 是否安装
-        ffmpeg_process = subprocess.run(
-            ffmpeg_check_cmd.split(),
-            capture_output=True,
-            text=True
-        )
+        # 检查 FFmpeg 是否安装（Windows 上使用 where，其他系统使用 which），在线程中执行，不阻塞事件循环
+        ffmpeg_process = await asyncio.to_thread(_which_ffmpeg)
 
         if ffmpeg_process.returncode == 0:
             # FFmpeg 已安装，获取版本信息
-            version_process = subprocess.run(['ffmpeg', '-version'], capture_output=True, text=True)
+            version_process = await asyncio.to_thread(_ffmpeg_version)
             if version_process.returncode == 0:
                 version_info = version_process.stdout.splitlines()[0]
                 return {
@@ -625,57 +976,7 @@ async def check_ffmpeg():
                 }
 
         # FFmpeg 未安装，准备安装指南
-        os_release = ""
-        try:
-            if os.path.exists('/etc/os-release'):
-                with open('/etc/os-release', 'r') as f:
-                    os_release = f.read().lower()
-        except Exception as e:
-            print(f"读取/etc/os-release 失败：{str(e)}")
-
-        install_guide = "请按照以下步骤安装 FFmpeg:\n\n"
-
-        if system == 'darwin':  # macOS
-            install_guide += "macOS 安装步骤:\n\n"
-            install_guide += "1. 使用 Homebrew 安装:\n"
-            install_guide += "brew install ffmpeg\n\n"
-            install_guide += "如果没有安装 Homebrew，请先安装 Homebrew:\n"
-            install_guide += '/bin/bash -c "$(curl -fsSL https://raw.githubusercontent.com/Homebrew/install/HEAD/install.sh)"'
-
-        elif system == 'linux':
-            if os.path.exists('/etc/centos-release') or 'centos' in os_release:
-                install_guide += "CentOS 7 安装步骤:\n\n"
-                install_guide += "1. 安装 EPEL 仓库:\n"
-                install_guide += "yum install -y epel-release\n\n"
-                install_guide += "2. 安装 RPM Fusion 仓库:\n"
-                install_guide += "yum localinstall -y --nogpgcheck https://download1.rpmfusion.org/free/el/rpmfusion-free-release-7.noarch.rpm\n\n"
-                install_guide += "3. 安装 FFmpeg:\n"
-                install_guide += "yum install -y ffmpeg ffmpeg-devel"
-
-            elif os.path.exists('/etc/debian_version') or 'ubuntu' in os_release or 'debian' in os_release:
-                install_guide += "Ubuntu/Debian 安装步骤:\n"
-                install_guide += "1. 更新包列表:\n"
-                install_guide += "apt-get update\n\n"
-                install_guide += "2. 安装 FFmpeg:\n"
-                install_guide += "apt-get install -y ffmpeg"
-
-            else:
-                install_guide += "未能识别的 Linux 发行版，请访问 FFmpeg 官网获取安装指南：\n"
-                install_guide += "https://ffmpeg.org/download.html"
-
-        elif system == 'windows':
-            install_guide += "Windows 安装步骤:\n\n"
-            install_guide += "1. 使用 Scoop 安装 (推荐):\n"
-            install_guide += "scoop install ffmpeg\n\n"
-            install_guide += "如果没有安装 Scoop，请先安装 Scoop:\n"
-            install_guide += "Set-ExecutionPolicy RemoteSigned -Scope CurrentUser\n"
-            install_guide += 'irm get.scoop.sh | iex\n\n'
-            install_guide += "2. 或者访问 FFmpeg 官网下载可执行文件:\n"
-            install_guide += "https://ffmpeg.org/download.html#build-windows"
-
-        else:
-            install_guide += "未能识别的操作系统，请访问 FFmpeg 官网获取安装指南：\n"
-            install_guide += "https://ffmpeg.org/download.html"
+        install_guide = _INSTALL_GUIDES[await asyncio.to_thread(_detect_distro)]
 
         return {
             "status": "error",
@@ -691,11 +992,7 @@ async def check_ffmpeg():
             "installed": False,
             "message": f"检查 FFmpeg 失败：{str(e)}",
             "error": str(e),
-            "os_info": os_info if 'os_info' in locals() else {
-                "system": platform.system().lower(),
-                "release": platform.release(),
-                "platform": platform.platform()
-            }
+            "os_info": os_info if 'os_info' in locals() else _os_info()
         }
 
 @router.get("/check_video_download", summary="检查视频是否已下载")
@@ -730,77 +1027,91 @@ async def check_video_download(cids: str):
                 "results": {cid: {"downloaded": False, "message": "下载目录不存在，视频尚未下载"} for cid in cid_list}
             }
 
-        # 存储每个 CID 的检查结果
-        result_dict = {}
-
-        # 递归遍历下载目录查找匹配的视频文件
-        for cid in cid_list:
-            found_files = []
-            found_directory = None
-            download_time = None
+        # 存储每个 CID 的查找状态，所有 CID 在同一次遍历中处理
+        found = {cid: {"files": [], "directory": None, "download_time": None} for cid in cid_list}
+        cid_by_str = {str(cid): cid for cid in found}
 
-            for root, dirs, files in os.walk(download_dir):
-                # 检查目录名是否包含 CID
-                dir_name = os.path.basename(root)
-                if f"_{cid}" in dir_name:
-                    found_directory = root
-
-                    # 从目录名中提取下载时间
-                    try:
-                        # 首先尝试从目录名中直接提取
-                        download_time = extract_datetime_from_string(dir_name)
+        def is_video_dir(dirpath):
+            return bool(_match_cids(os.path.basename(dirpath), cid_by_str))
 
-                        # 如果没找到，尝试从目录名的各个部分提取
-                        if not download_time:
-                            dir_parts = dir_name.split('_')
-                            for part in dir_parts:
-                                extracted_time = extract_datetime_from_string(part)
-                                if extracted_time:
-                                    download_time = extracted_time
-                                    break
+        # 递归遍历下载目录查找匹配的视频文件（只遍历一次）
+        # 已找到视频目录时遍历不再进入其子目录
+        for root, dirs, files in await _scan_tree_parallel(download_dir, prune=is_video_dir):
+            # 检查目录名是否包含 CID
+            dir_name = os.path.basename(root)
+            matched_cids = _match_cids(dir_name, cid_by_str)
+            if not matched_cids:
+                continue
 
-                        # 如果仍然没找到，尝试使用文件的创建时间
-                        if not download_time and files:  # 确保有文件存在
-                            # 使用第一个文件的创建时间
-                            first_file_path = os.path.join(root, files[0])
-                            if os.path.exists(first_file_path):
-                                creation_time = os.path.getctime(first_file_path)
-                                download_time = datetime.fromtimestamp(creation_time).strftime("%Y-%m-%d %H:%M:%S")
-                                print(f"【调试】使用文件创建时间作为下载时间：{download_time}")
-
-                        # 额外记录调试信息
-                        if not download_time:
-                            print(f"【调试】无法从目录名提取日期时间：{dir_name}")
-                            print(f"【调试】目录名各部分：{dir_name.split('_')}")
-                    except Exception as e:
-                        print(f"提取下载时间出错：{str(e)}")
+            # 从目录名中提取下载时间
+            download_time = None
+            try:
+                # 首先尝试从目录名中直接提取
+                download_time = extract_datetime_from_string(dir_name)
 
-                    # 检查目录中的文件
-                    for file in files:
-                        # 检查文件名是否包含 CID
-                        if f"_{cid}" in file:
-                            # 检查是否为视频或音频文件
-                            if file.endswith(('.mp4', '.flv', '.m4a', '.mp3')):
-                                file_path = os.path.join(root, file)
-                                file_size = os.path.getsize(file_path)
-                                file_size_mb = round(file_size / (1024 * 1024), 2)
+                # 如果没找到，尝试从目录名的各个部分提取
+                if not download_time:
+                    dir_parts = dir_name.split('_')
+                    for part in dir_parts:
+                        extracted_time = extract_datetime_from_string(part)
+                        if extracted_time:
+                            download_time = extracted_time
+                            break
 
-                                found_files.append({
-                                    "file_name": file,
-                                    "file_path": file_path,
-                                    "size_bytes": file_size,
-                                    "size_mb": file_size_mb,
-                                    "created_time": os.path.getctime(file_path),
-                                    "modified_time": os.path.getmtime(file_path)
-                                })
+                # 如果仍然没找到，尝试使用文件的创建时间
+                if not download_time and files:  # 确保有文件存在
+                    # 使用第一个文件的创建时间
+                    try:
+                        creation_time = files[0].stat().st_ctime
+                    except OSError:
+                        creation_time = None
+                    if creation_time is not None:
+                        download_time = datetime.fromtimestamp(creation_time).strftime("%Y-%m-%d %H:%M:%S")
+                        logger.debug(f"使用文件创建时间作为下载时间：{download_time}")
+
+                # 额外记录调试信息
+                if not download_time:
+                    logger.debug(f"无法从目录名提取日期时间：{dir_name}")
+                    logger.debug(f"目录名各部分：{dir_name.split('_')}")
+            except Exception as e:
+                logger.error(f"提取下载时间出错：{str(e)}")
+
+            for cid in matched_cids:
+                state = found[cid]
+                state["directory"] = root
+                state["download_time"] = download_time
+
+                # 检查目录中的文件
+                for entry in files:
+                    file = entry.name
+                    # 检查文件名是否包含 CID
+                    if f"_{cid}" in file:
+                        # 检查是否为视频或音频文件
+                        if file[file.rfind('.'):] in _MEDIA_EXTS:
+                            # 一次 stat 同时取得大小和时间
+                            st = entry.stat()
+                            file_size = st.st_size
+                            file_size_mb = round(file_size / (1024 * 1024), 2)
+
+                            state["files"].append({
+                                "file_name": file,
+                                "file_path": entry.path,
+                                "size_bytes": file_size,
+                                "size_mb": file_size_mb,
+                                "created_time": st.st_ctime,
+                                "modified_time": st.st_mtime
+                            })
 
-            if found_files:
+        result_dict = {}
+        for cid in cid_list:
+            state = found[cid]
+            if state["files"]:
                 result_dict[cid] = {
                     "downloaded": True,
-                    "message": f"已找到{len(found_files)}个匹配的视频文件",
-                    "files": found_files,
-                    "directory": found_directory,
-                    "download_time": download_time
+                    "message": f"已找到{len(state['files'])}个匹配的视频文件",
+                    "files": state["files"],
+                    "directory": state["directory"],
+                    "download_time": state["download_time"]
                 }
             else:
                 result_dict[cid] = {
@@ -819,6 +1130,9 @@ async def check_video_download(cids: str):
             "message": f"检查视频下载状态时出错：{str(e)}"
         }
 
+# 批量按 CID 查询数据库时每条语句的参数个数，低于旧版 SQLite 的 999 个上限
+SQLITE_IN_BATCH = 500
+
 @router.get("/list_downloaded_videos", summary="获取或搜索已下载视频列表")
 async def list_downloaded_videos(search_term: Optional[str] = None, limit: int = 100, page: int = 1, use_local_images: bool = False):
     """
@@ -857,78 +1171,45 @@ async def list_downloaded_videos(search_term: Optional[str] = None, limit: int =
             conn.row_factory = sqlite3.Row  # 将结果转换为字典形式
             db_available = True
         except Exception as e:
-            print(f"无法连接到数据库：{str(e)}")
+            logger.error(f"无法连接到数据库：{str(e)}")
             db_available = False
             conn = None
 
         # 递归遍历下载目录查找视频文件
-        videos = []
+        candidates = []
 
-        for root, dirs, files in os.walk(download_dir):
+        for root, dirs, file_entries in await _scan_tree_parallel(download_dir):
             # 过滤仅包含视频文件的目录
             video_files = []
             dir_name = os.path.basename(root)
+            # 文件名 -> DirEntry，迭代时按目录顺序得到文件名
+            files = {entry.name: entry for entry in file_entries}
 
             # 如果指定了搜索关键词，检查目录名
             if search_term and search_term.lower() not in dir_name.lower():
                 # 跳过不匹配的目录，除非发现其中的文件名匹配
                 file_match = False
                 for file in files:
-                    if search_term.lower() in file.lower() and file.endswith(('.mp4', '.flv', '.m4a', '.mp3')):
+                    if search_term.lower() in file.lower() and file[file.rfind('.'):] in _MEDIA_EXTS:
                         file_match = True
                         break
 
                 if not file_match:
                     continue
 
-            # 检查是否存在元数据文件
-            metadata_file = os.path.join(root, "metadata.json")
-            metadata = None
-            if os.path.exists(metadata_file):
-                try:
-                    with open(metadata_file, 'r', encoding='utf-8') as f:
-                        import json
-                        metadata = json.load(f)
-                    print(f"【调试】从元数据文件获取数据：{metadata_file}")
-
-                    # 显示元数据文件内容摘要
-                    if 'title' in metadata:
-                        print(f"【调试】元数据标题：{metadata['title']}")
-                    if 'id' in metadata:
-                        if 'bvid' in metadata['id']:
-                            print(f"【调试】元数据 BVID: {metadata['id']['bvid']}")
-                        if 'cid' in metadata['id']:
-                            print(f"【调试】元数据 CID: {metadata['id']['cid']}")
-                    if 'owner' in metadata and 'name' in metadata['owner']:
-                        print(f"【调试】元数据作者：{metadata['owner']['name']}")
-                    if 'cover_url' in metadata:
-                        print(f"【调试】元数据封面：{metadata['cover_url']}")
-
-                except Exception as e:
-                    print(f"读取元数据文件出错：{str(e)}")
-
-            # 尝试查找.nfo 文件
-            nfo_files = [f for f in files if f.endswith('.nfo')]
-            nfo_data = None
-            if nfo_files:
-                try:
-                    import xml.etree.ElementTree as ET
-                    nfo_file = os.path.join(root, nfo_files[0])
-                    tree = ET.parse(nfo_file)
-                    nfo_data = tree.getroot()
-                    print(f"【调试】从 NFO 文件获取数据：{nfo_file}")
-                except Exception as e:
-                    print(f"读取 NFO 文件出错：{str(e)}")
-
-            for file in files:
+            for entry in file_entries:
+                file = entry.name
+                ext = file[file.rfind('.'):]
                 # 检查是否为视频或音频文件
-                if file.endswith(('.mp4', '.flv', '.m4a', '.mp3')):
+                if ext in _MEDIA_EXTS:
                     # 如果指定了搜索关键词，检查文件名
                     if search_term and search_term.lower() not in file.lower() and search_term.lower() not in dir_name.lower():
                         continue
 
-                    file_path = os.path.join(root, file)
-                    file_size = os.path.getsize(file_path)
+                    file_path = entry.path
+                    # 一次 stat 同时取得大小和时间
+                    st = entry.stat()
+                    file_size = st.st_size
                     file_size_mb = round(file_size / (1024 * 1024), 2)
 
                     # 从目录名和文件名中提取信息
@@ -957,7 +1238,7 @@ async def list_downloaded_videos(search_term: Optional[str] = None, limit: int =
                     # 尝试提取日期时间
                     date_time = None
                     try:
-                        print(f"【调试】处理目录：{dir_name}")
+                        logger.debug(f"处理目录：{dir_name}")
 
                         # 首先尝试从完整目录名中直接提取
                         date_time = extract_datetime_from_string(dir_name)
@@ -965,35 +1246,34 @@ async def list_downloaded_videos(search_term: Optional[str] = None, limit: int =
                         # 如果没找到，尝试从目录名的各个部分提取
                         if not date_time:
                             dir_parts = dir_name.split('_')
-                            print(f"【调试】目录名各部分：{dir_parts}")
+                            logger.debug(f"目录名各部分：{dir_parts}")
                             for part in dir_parts:
-                                print(f"【调试】检查部分：{part}")
+                                logger.debug(f"检查部分：{part}")
                                 extracted_time = extract_datetime_from_string(part)
                                 if extracted_time:
                                     date_time = extracted_time
-                                    print(f"【调试】从部分'{part}'提取到时间：{date_time}")
+                                    logger.debug(f"从部分'{part}'提取到时间：{date_time}")
                                     break
 
                         # 如果仍然没找到，尝试使用文件的创建时间
                         if not date_time:
                             # 使用即将添加到 video_files 的文件创建时间
-                            creation_time = os.path.getctime(file_path)
-                            date_time = datetime.fromtimestamp(creation_time).strftime("%Y-%m-%d %H:%M:%S")
-                            print(f"【调试】使用文件创建时间作为下载时间：{date_time}")
+                            date_time = datetime.fromtimestamp(st.st_ctime).strftime("%Y-%m-%d %H:%M:%S")
+                            logger.debug(f"使用文件创建时间作为下载时间：{date_time}")
 
                             # 额外记录调试信息
-                            print(f"【调试】无法从目录名提取日期时间：{dir_name}")
+                            logger.debug(f"无法从目录名提取日期时间：{dir_name}")
                     except Exception as e:
-                        print(f"提取下载时间出错：{str(e)}")
+                        logger.error(f"提取下载时间出错：{str(e)}")
 
                     video_files.append({
                         "file_name": file,
                         "file_path": file_path,
                         "size_bytes": file_size,
                         "size_mb": file_size_mb,
-                        "created_time": os.path.getctime(file_path),
-                        "modified_time": os.path.getmtime(file_path),
-                        "is_audio_only": file.endswith(('.m4a', '.mp3'))
+                        "created_time": st.st_ctime,
+                        "modified_time": st.st_mtime,
+                        "is_audio_only": ext in _AUDIO_EXTS
                     })
 
             if video_files:
@@ -1011,106 +1291,263 @@ async def list_downloaded_videos(search_term: Optional[str] = None, limit: int =
                     "author_mid": None
                 }
 
-                # 如果存在元数据，优先使用元数据中的信息
-                if metadata:
-                    try:
-                        # 提取 bvid 和 cid
-                        if 'id' in metadata:
-                            video_id = metadata['id']
-                            if 'bvid' in video_id:
-                                video_info["bvid"] = video_id['bvid']
-                            if 'cid' in video_id and not video_info["cid"]:
-                                video_info["cid"] = str(video_id['cid'])
-
-                        # 提取标题
-                        if 'title' in metadata and metadata['title']:
-                            video_info["title"] = metadata['title']
-
-                        # 提取封面 URL
-                        if 'cover_url' in metadata and metadata['cover_url']:
-                            video_info["cover"] = metadata['cover_url']
-
-                        # 提取作者信息
-                        if 'owner' in metadata:
-                            owner = metadata['owner']
-                            if 'name' in owner:
-                                video_info["author_name"] = owner['name']
-                            if 'face' in owner:
-                                video_info["author_face"] = owner['face']
-                            if 'mid' in owner:
-                                video_info["author_mid"] = owner['mid']
+                # 先只收集轻量的候选项，元数据/NFO/数据库等信息在分页后只为当前页补全
+                # 排序键（目录内最新的文件修改时间）在这里算好，排序时不再重复计算
+                newest_mtime = max(f["modified_time"] for f in video_files)
+                candidates.append((newest_mtime, video_info, root, files))
 
-                        # 处理图片 URL
-                        if _process_image_url:
-                            # 使用导入的函数处理图片 URL
-                            if video_info["cover"]:
-                                video_info["cover"] = _process_image_url(video_info["cover"], 'covers', use_local_images)
-                            if video_info["author_face"]:
-                                video_info["author_face"] = _process_image_url(video_info["author_face"], 'avatars', use_local_images)
-                        elif hasattr(sys.modules.get('routers.history'), '_process_image_url'):
-                            # 如果导入失败但模块运行时可访问，再次尝试
-                            process_url = getattr(sys.modules.get('routers.history'), '_process_image_url')
-                            if video_info["cover"]:
-                                video_info["cover"] = process_url(video_info["cover"], 'covers', use_local_images)
-                            if video_info["author_face"]:
-                                video_info["author_face"] = process_url(video_info["author_face"], 'avatars', use_local_images)
-                        elif use_local_images:
-                            # 简单的 URL 处理逻辑，作为后备方案
-                            import hashlib
-                            if video_info["cover"]:
-                                cover_hash = hashlib.md5(video_info["cover"].encode()).hexdigest()
-                                video_info["cover"] = f"http://localhost:8899/images/local/covers/{cover_hash}"
-                            if video_info["author_face"]:
-                                avatar_hash = hashlib.md5(video_info["author_face"].encode()).hexdigest()
-                                video_info["author_face"] = f"http://localhost:8899/images/local/avatars/{avatar_hash}"
+        # 计算分页
+        total_videos = len(candidates)
+        total_pages = (total_videos + limit - 1) // limit if total_videos > 0 else 0
 
-                        print(f"【调试】从元数据获取到视频信息：{video_info['title']}，封面 URL: {video_info['cover'][:50]}...")
-                    except Exception as e:
-                        print(f"解析元数据时出错：{str(e)}")
+        # 分页
+        start_idx = (page - 1) * limit
+        end_idx = min(start_idx + limit, total_videos)
 
-                # 如果有 NFO 数据且信息不完整，尝试从 NFO 提取
-                if nfo_data and (not video_info["cover"] or not video_info["author_name"] or not video_info["author_face"]):
-                    try:
-                        # 提取标题
-                        title_elem = nfo_data.find('title')
-                        if title_elem is not None and title_elem.text and not video_info["title"]:
-                            video_info["title"] = title_elem.text
-
-                        # 提取封面 URL
-                        thumb_elem = nfo_data.find('thumb')
-                        if thumb_elem is not None and thumb_elem.text and not video_info["cover"]:
-                            video_info["cover"] = thumb_elem.text
-
-                        # 提取作者信息
-                        actor_elem = nfo_data.find('actor')
-                        if actor_elem is not None:
-                            # 作者名
-                            actor_name = actor_elem.find('name')
-                            if actor_name is not None and actor_name.text and not video_info["author_name"]:
-                                video_info["author_name"] = actor_name.text
-
-                            # 作者头像
-                            actor_thumb = actor_elem.find('thumb')
-                            if actor_thumb is not None and actor_thumb.text and not video_info["author_face"]:
-                                video_info["author_face"] = actor_thumb.text
-
-                            # 作者 ID/主页
-                            actor_profile = actor_elem.find('profile')
-                            if actor_profile is not None and actor_profile.text and not video_info["author_mid"]:
-                                profile_url = actor_profile.text
-                                # 尝试从 URL 中提取 mid
-                                mid_match = re.search(r"space\.bilibili\.com/(\d+)", profile_url)
-                                if mid_match:
-                                    video_info["author_mid"] = int(mid_match.group(1))
-
-                        # 提取 BV 号
-                        website_elem = nfo_data.find('website')
-                        if website_elem is not None and website_elem.text and not video_info["bvid"]:
-                            bvid_match = re.search(r"video/(BV\w+)", website_elem.text)
-                            if bvid_match:
-                                video_info["bvid"] = bvid_match.group(1)
-
-                        # 处理 NFO 文件中的图片 URL
+        # 根据修改时间排序，最新的在前面；只需要前 end_idx 个，用堆取前 N 项代替全量排序
+        # heapq.nlargest 与 sorted(..., reverse=True)[:n] 结果一致，修改时间相同的保持原有顺序
+        page_candidates = heapq.nlargest(end_idx, candidates, key=lambda x: x[0])[start_idx:] if start_idx < total_videos else []
+
+        # 只为当前页的视频读取元数据、NFO 文件或查询 API/数据库
+        paginated_videos = []
+        # 没有元数据和 NFO 文件、需要通过 API/数据库补全的视频
+        pending = []
+        for _, video_info, root, files in page_candidates:
+            cid = video_info["cid"]
+
+            # 检查是否存在元数据文件
+            metadata_file = os.path.join(root, "metadata.json")
+            metadata = None
+            metadata_entry = files.get("metadata.json")
+            # 空的元数据文件直接跳过，大小取自 DirEntry 缓存的 stat 结果
+            if metadata_entry is not None and metadata_entry.stat().st_size > 0:
+                try:
+                    # 在线程中按字节读取，不阻塞事件循环；由 json.loads 直接解析 UTF-8，省去文本层的解码和换行转换
+                    metadata = json.loads(await asyncio.to_thread(_read_bytes, metadata_file))
+                    logger.debug(f"从元数据文件获取数据：{metadata_file}")
+
+                    # 显示元数据文件内容摘要
+                    if 'title' in metadata:
+                        logger.debug(f"元数据标题：{metadata['title']}")
+                    if 'id' in metadata:
+                        if 'bvid' in metadata['id']:
+                            logger.debug(f"元数据 BVID: {metadata['id']['bvid']}")
+                        if 'cid' in metadata['id']:
+                            logger.debug(f"元数据 CID: {metadata['id']['cid']}")
+                    if 'owner' in metadata and 'name' in metadata['owner']:
+                        logger.debug(f"元数据作者：{metadata['owner']['name']}")
+                    if 'cover_url' in metadata:
+                        logger.debug(f"元数据封面：{metadata['cover_url']}")
+
+                except Exception as e:
+                    logger.error(f"读取元数据文件出错：{str(e)}")
+
+            # 尝试查找.nfo 文件
+            nfo_files = [f for f in files if f.endswith('.nfo')]
+            nfo_data = None
+            if nfo_files:
+                try:
+                    import xml.etree.ElementTree as ET
+                    nfo_file = os.path.join(root, nfo_files[0])
+                    tree = await asyncio.to_thread(ET.parse, nfo_file)
+                    nfo_data = tree.getroot()
+                    logger.debug(f"从 NFO 文件获取数据：{nfo_file}")
+                except Exception as e:
+                    logger.error(f"读取 NFO 文件出错：{str(e)}")
+
+            # 如果存在元数据，优先使用元数据中的信息
+            if metadata:
+                try:
+                    # 提取 bvid 和 cid
+                    if 'id' in metadata:
+                        video_id = metadata['id']
+                        if 'bvid' in video_id:
+                            video_info["bvid"] = video_id['bvid']
+                        if 'cid' in video_id and not video_info["cid"]:
+                            video_info["cid"] = str(video_id['cid'])
+
+                    # 提取标题
+                    if 'title' in metadata and metadata['title']:
+                        video_info["title"] = metadata['title']
+
+                    # 提取封面 URL
+                    if 'cover_url' in metadata and metadata['cover_url']:
+                        video_info["cover"] = metadata['cover_url']
+
+                    # 提取作者信息
+                    if 'owner' in metadata:
+                        owner = metadata['owner']
+                        if 'name' in owner:
+                            video_info["author_name"] = owner['name']
+                        if 'face' in owner:
+                            video_info["author_face"] = owner['face']
+                        if 'mid' in owner:
+                            video_info["author_mid"] = owner['mid']
+
+                    # 处理图片 URL
+                    if _process_image_url:
+                        # 使用导入的函数处理图片 URL
+                        if video_info["cover"]:
+                            video_info["cover"] = _process_image_url(video_info["cover"], 'covers', use_local_images)
+                        if video_info["author_face"]:
+                            video_info["author_face"] = _process_image_url(video_info["author_face"], 'avatars', use_local_images)
+                    elif hasattr(sys.modules.get('routers.history'), '_process_image_url'):
+                        # 如果导入失败但模块运行时可访问，再次尝试
+                        process_url = getattr(sys.modules.get('routers.history'), '_process_image_url')
+                        if video_info["cover"]:
+                            video_info["cover"] = process_url(video_info["cover"], 'covers', use_local_images)
+                        if video_info["author_face"]:
+                            video_info["author_face"] = process_url(video_info["author_face"], 'avatars', use_local_images)
+                    elif use_local_images:
+                        # 简单的 URL 处理逻辑，作为后备方案
+                        import hashlib
+                        if video_info["cover"]:
+                            cover_hash = hashlib.md5(video_info["cover"].encode()).hexdigest()
+                            video_info["cover"] = f"http://localhost:8899/images/local/covers/{cover_hash}"
+                        if video_info["author_face"]:
+                            avatar_hash = hashlib.md5(video_info["author_face"].encode()).hexdigest()
+                            video_info["author_face"] = f"http://localhost:8899/images/local/avatars/{avatar_hash}"
+
+                    logger.debug(f"从元数据获取到视频信息：{video_info['title']}，封面 URL: {video_info['cover'][:50]}...")
+                except Exception as e:
+                    logger.error(f"解析元数据时出错：{str(e)}")
+
+            # 如果有 NFO 数据且信息不完整，尝试从 NFO 提取
+            if nfo_data and (not video_info["cover"] or not video_info["author_name"] or not video_info["author_face"]):
+                try:
+                    # 提取标题
+                    title_elem = nfo_data.find('title')
+                    if title_elem is not None and title_elem.text and not video_info["title"]:
+                        video_info["title"] = title_elem.text
+
+                    # 提取封面 URL
+                    thumb_elem = nfo_data.find('thumb')
+                    if thumb_elem is not None and thumb_elem.text and not video_info["cover"]:
+                        video_info["cover"] = thumb_elem.text
+
+                    # 提取作者信息
+                    actor_elem = nfo_data.find('actor')
+                    if actor_elem is not None:
+                        # 作者名
+                        actor_name = actor_elem.find('name')
+                        if actor_name is not None and actor_name.text and not video_info["author_name"]:
+                            video_info["author_name"] = actor_name.text
+
+                        # 作者头像
+                        actor_thumb = actor_elem.find('thumb')
+                        if actor_thumb is not None and actor_thumb.text and not video_info["author_face"]:
+                            video_info["author_face"] = actor_thumb.text
+
+                        # 作者 ID/主页
+                        actor_profile = actor_elem.find('profile')
+                        if actor_profile is not None and actor_profile.text and not video_info["author_mid"]:
+                            profile_url = actor_profile.text
+                            # 尝试从 URL 中提取 mid
+                            mid_match = _RE_MID.search(profile_url)
+                            if mid_match:
+                                video_info["author_mid"] = int(mid_match.group(1))
+
+                    # 提取 BV 号
+                    website_elem = nfo_data.find('website')
+                    if website_elem is not None and website_elem.text and not video_info["bvid"]:
+                        bvid_match = _RE_BVID.search(website_elem.text)
+                        if bvid_match:
+                            video_info["bvid"] = bvid_match.group(1)
+
+                    # 处理 NFO 文件中的图片 URL
+                    if _process_image_url:
+                        # 使用导入的函数处理图片 URL
+                        if video_info["cover"]:
+                            video_info["cover"] = _process_image_url(video_info["cover"], 'covers', use_local_images)
+                        if video_info["author_face"]:
+                            video_info["author_face"] = _process_image_url(video_info["author_face"], 'avatars', use_local_images)
+                    elif hasattr(sys.modules.get('routers.history'), '_process_image_url'):
+                        # 如果导入失败但模块运行时可访问，再次尝试
+                        process_url = getattr(sys.modules.get('routers.history'), '_process_image_url')
+                        if video_info["cover"]:
+                            video_info["cover"] = process_url(video_info["cover"], 'covers', use_local_images)
+                        if video_info["author_face"]:
+                            video_info["author_face"] = process_url(video_info["author_face"], 'avatars', use_local_images)
+                    elif use_local_images:
+                        # 简单的 URL 处理逻辑，作为后备方案
+                        import hashlib
+                        if video_info["cover"]:
+                            cover_hash = hashlib.md5(video_info["cover"].encode()).hexdigest()
+                            video_info["cover"] = f"http://localhost:8899/images/local/covers/{cover_hash}"
+                        if video_info["author_face"]:
+                            avatar_hash = hashlib.md5(video_info["author_face"].encode()).hexdigest()
+                            video_info["author_face"] = f"http://localhost:8899/images/local/avatars/{avatar_hash}"
+
+                    logger.debug(f"从 NFO 文件获取到视频信息：{video_info['title']}，封面 URL: {video_info['cover'][:50] if video_info['cover'] else 'None'}")
+                except Exception as e:
+                    logger.error(f"解析 NFO 文件时出错：{str(e)}")
+
+            # 如果有 CID 但没有其他信息，留到当前页处理完后再统一通过 API/数据库获取
+            if not metadata and not nfo_data and cid and cid.isdigit() and (not video_info["cover"] or not video_info["author_name"] or not video_info["author_face"]):
+                pending.append((video_info, cid))
+
+            paginated_videos.append(video_info)
+
+        # 直接查询数据库时，每个年份表只执行一次 IN 查询取回当前页所有待补全的 CID，
+        # 而不是每个视频单独执行一次联合查询
+        history_by_cid = {}
+        if pending and not get_video_by_cid and db_available:
+            try:
+                pending_cids = list({int(cid) for _, cid in pending})
+                cursor = conn.cursor()
+                history_years = [table_name.split('_')[-1]
+                                 for (table_name,) in cursor.execute(
+                                     "SELECT name FROM sqlite_master WHERE type='table' AND name LIKE 'bilibili_history_%'"
+                                 ).fetchall()
+                                 if table_name.split('_')[-1].isdigit()]
+                for year in history_years:
+                    # 分批查询，避免超出 SQLite 单条语句的参数个数上限
+                    for i in range(0, len(pending_cids), SQLITE_IN_BATCH):
+                        batch = pending_cids[i:i + SQLITE_IN_BATCH]
+                        rows = cursor.execute(
+                            f"SELECT cid, title, cover, author_face, author_name, author_mid, bvid FROM bilibili_history_{year} WHERE cid IN ({','.join('?' * len(batch))})",
+                            batch
+                        ).fetchall()
+                        # 与原来的联合查询一致，按表顺序保留最先查到的记录
+                        for row in rows:
+                            history_by_cid.setdefault(int(row["cid"]), row)
+            except Exception as e:
+                logger.error(f"批量查询视频信息时出错：{str(e)}")
+
+        for video_info, cid in pending:
+            try:
+                # 仅当没有元数据和 NFO 文件时，才尝试通过 API 或数据库获取
+                logger.debug(f"没有找到元数据或 NFO 文件，尝试通过 API/数据库获取 CID={cid}的视频信息")
+
+                # 方式 1: 直接调用 get_video_by_cid 函数（如果已成功导入）
+                if get_video_by_cid:
+                    logger.debug(f"使用导入的 get_video_by_cid 函数获取 CID={cid}的视频信息")
+                    # 调用 API 函数获取视频信息
+                    api_response = await get_video_by_cid(int(cid), use_local_images)
+
+                    if api_response["status"] == "success" and "data" in api_response:
+                        video_data = api_response["data"]
+                        video_info["title"] = video_data.get("title") or video_info["title"]
+                        video_info["cover"] = video_data.get("cover")
+                        video_info["author_face"] = video_data.get("author_face")
+                        video_info["author_name"] = video_data.get("author_name")
+                        video_info["author_mid"] = video_data.get("author_mid")
+                        video_info["bvid"] = video_data.get("bvid")  # 添加 bvid 字段
+                        logger.debug(f"成功通过 API 获取到视频信息：{video_data.get('title')}")
+                # 方式 2: 如果 API 函数未导入，则回退到直接查询数据库
+                elif db_available:
+                    logger.debug(f"回退到直接查询数据库获取 CID={cid}的视频信息")
+                    result = history_by_cid.get(int(cid))
+                    if result:
+                        # 设置封面和作者信息
+                        video_info["title"] = result["title"] or video_info["title"]
+                        video_info["cover"] = result["cover"]
+                        video_info["author_face"] = result["author_face"]
+                        video_info["author_name"] = result["author_name"]
+                        video_info["author_mid"] = result["author_mid"]
+                        video_info["bvid"] = result["bvid"]  # 添加 bvid 字段
+
+                        # 处理图片 URL
                         if _process_image_url:
                             # 使用导入的函数处理图片 URL
                             if video_info["cover"]:
@@ -1124,116 +1561,23 @@ async def list_downloaded_videos(search_term: Optional[str] = None, limit: int =
                                 video_info["cover"] = process_url(video_info["cover"], 'covers', use_local_images)
                             if video_info["author_face"]:
                                 video_info["author_face"] = process_url(video_info["author_face"], 'avatars', use_local_images)
-                        elif use_local_images:
+                        else:
                             # 简单的 URL 处理逻辑，作为后备方案
-                            import hashlib
-                            if video_info["cover"]:
-                                cover_hash = hashlib.md5(video_info["cover"].encode()).hexdigest()
-                                video_info["cover"] = f"http://localhost:8899/images/local/covers/{cover_hash}"
-                            if video_info["author_face"]:
-                                avatar_hash = hashlib.md5(video_info["author_face"].encode()).hexdigest()
-                                video_info["author_face"] = f"http://localhost:8899/images/local/avatars/{avatar_hash}"
-
-                        print(f"【调试】从 NFO 文件获取到视频信息：{video_info['title']}，封面 URL: {video_info['cover'][:50] if video_info['cover'] else 'None'}")
-                    except Exception as e:
-                        print(f"解析 NFO 文件时出错：{str(e)}")
-
-                # 如果有 CID 但没有其他信息，尝试通过 API 获取
-                if not metadata and not nfo_data and cid and cid.isdigit() and (not video_info["cover"] or not video_info["author_name"] or not video_info["author_face"]):
-                    try:
-                        # 仅当没有元数据和 NFO 文件时，才尝试通过 API 或数据库获取
-                        print(f"【调试】没有找到元数据或 NFO 文件，尝试通过 API/数据库获取 CID={cid}的视频信息")
-
-                        # 方式 1: 直接调用 get_video_by_cid 函数（如果已成功导入）
-                        if get_video_by_cid:
-                            print(f"【调试】使用导入的 get_video_by_cid 函数获取 CID={cid}的视频信息")
-                            # 调用 API 函数获取视频信息
-                            api_response = await get_video_by_cid(int(cid), use_local_images)
-
-                            if api_response["status"] == "success" and "data" in api_response:
-                                video_data = api_response["data"]
-                                video_info["title"] = video_data.get("title") or video_info["title"]
-                                video_info["cover"] = video_data.get("cover")
-                                video_info["author_face"] = video_data.get("author_face")
-                                video_info["author_name"] = video_data.get("author_name")
-                                video_info["author_mid"] = video_data.get("author_mid")
-                                video_info["bvid"] = video_data.get("bvid")  # 添加 bvid 字段
-                                print(f"【调试】成功通过 API 获取到视频信息：{video_data.get('title')}")
-                        # 方式 2: 如果 API 函数未导入，则回退到直接查询数据库
-                        elif db_available:
-                            print(f"【调试】回退到直接查询数据库获取 CID={cid}的视频信息")
-                            cursor = conn.cursor()
-                            # 查询所有历史记录表
-                            years = [table_name.split('_')[-1]
-                                    for (table_name,) in cursor.execute(
-                                        "SELECT name FROM sqlite_master WHERE type='table' AND name LIKE 'bilibili_history_%'"
-                                    ).fetchall()
-                                    if table_name.split('_')[-1].isdigit()]
-
-                            # 构建 UNION ALL 查询所有年份表
-                            if years:
-                                queries = []
-                                for year in years:
-                                    queries.append(f"SELECT title, cover, author_face, author_name, author_mid, bvid FROM bilibili_history_{year} WHERE cid = {cid} LIMIT 1")
-
-                                # 执行联合查询
-                                union_query = " UNION ALL ".join(queries) + " LIMIT 1"
-                                result = cursor.execute(union_query).fetchone()
-
-                                if result:
-                                    # 设置封面和作者信息
-                                    video_info["title"] = result["title"] or video_info["title"]
-                                    video_info["cover"] = result["cover"]
-                                    video_info["author_face"] = result["author_face"]
-                                    video_info["author_name"] = result["author_name"]
-                                    video_info["author_mid"] = result["author_mid"]
-                                    video_info["bvid"] = result["bvid"]  # 添加 bvid 字段
-
-                                    # 处理图片 URL
-                                    if _process_image_url:
-                                        # 使用导入的函数处理图片 URL
-                                        if video_info["cover"]:
-                                            video_info["cover"] = _process_image_url(video_info["cover"], 'covers', use_local_images)
-                                        if video_info["author_face"]:
-                                            video_info["author_face"] = _process_image_url(video_info["author_face"], 'avatars', use_local_images)
-                                    elif hasattr(sys.modules.get('routers.history'), '_process_image_url'):
-                                        # 如果导入失败但模块运行时可访问，再次尝试
-                                        process_url = getattr(sys.modules.get('routers.history'), '_process_image_url')
-                                        if video_info["cover"]:
-                                            video_info["cover"] = process_url(video_info["cover"], 'covers', use_local_images)
-                                        if video_info["author_face"]:
-                                            video_info["author_face"] = process_url(video_info["author_face"], 'avatars', use_local_images)
-                                    else:
-                                        # 简单的 URL 处理逻辑，作为后备方案
-                                        if use_local_images:
-                                            import hashlib
-                                            if video_info["cover"]:
-                                                cover_hash = hashlib.md5(video_info["cover"].encode()).hexdigest()
-                                                video_info["cover"] = f"http://localhost:8899/images/local/covers/{cover_hash}"
-                                            if video_info["author_face"]:
-                                                avatar_hash = hashlib.md5(video_info["author_face"].encode()).hexdigest()
-                                                video_info["author_face"] = f"http://localhost:8899/images/local/avatars/{avatar_hash}"
-                    except Exception as e:
-                        print(f"获取视频信息时出错：{str(e)}")
-
-                videos.append(video_info)
+                            if use_local_images:
+                                import hashlib
+                                if video_info["cover"]:
+                                    cover_hash = hashlib.md5(video_info["cover"].encode()).hexdigest()
+                                    video_info["cover"] = f"http://localhost:8899/images/local/covers/{cover_hash}"
+                                if video_info["author_face"]:
+                                    avatar_hash = hashlib.md5(video_info["author_face"].encode()).hexdigest()
+                                    video_info["author_face"] = f"http://localhost:8899/images/local/avatars/{avatar_hash}"
+            except Exception as e:
+                logger.error(f"获取视频信息时出错：{str(e)}")
 
         # 如果数据库连接已打开，关闭它
         if conn:
             conn.close()
 
-        # 计算分页
-        total_videos = len(videos)
-        total_pages = (total_videos + limit - 1) // limit if total_videos > 0 else 0
-
-        # 根据修改时间排序，最新的在前面
-        videos.sort(key=lambda x: max([f["modified_time"] for f in x["files"]]) if x["files"] else 0, reverse=True)
-
-        # 分页
-        start_idx = (page - 1) * limit
-        end_idx = min(start_idx + limit, total_videos)
-        paginated_videos = videos[start_idx:end_idx] if start_idx < total_videos else []
-
         return {
             "status": "success",
             "message": f"找到{total_videos}个视频" + (f"，匹配'{search_term}'" if search_term else ""),
@@ -1270,29 +1614,18 @@ async def stream_video(file_path: str):
             )
 
         # 检查是否是支持的媒体文件
-        if not file_path.endswith(('.mp4', '.flv', '.m4a', '.mp3')):
+        ext = file_path[file_path.rfind('.'):]
+        if ext not in _MEDIA_EXTS:
             raise HTTPException(
                 status_code=400,
                 detail="不支持的媒体文件格式，仅支持 mp4、flv、m4a、mp3 格式"
             )
 
-        # 获取文件大小
-        file_size = os.path.getsize(file_path)
-
         # 获取文件名
         file_name = os.path.basename(file_path)
 
         # 设置适当的媒体类型
-        if file_path.endswith('.mp4'):
-            media_type = 'video/mp4'
-        elif file_path.endswith('.flv'):
-            media_type = 'video/x-flv'
-        elif file_path.endswith('.m4a'):
-            media_type = 'audio/mp4'
-        elif file_path.endswith('.mp3'):
-            media_type = 'audio/mpeg'
-        else:
-            media_type = 'application/octet-stream'
+        media_type = _MEDIA_TYPES.get(ext, 'application/octet-stream')
 
         # 返回文件响应
         return FileResponse(
@@ -1371,33 +1704,32 @@ async def delete_downloaded_video(
                 # 查找目录中的视频文件并删除
                 for file in os.listdir(directory):
                     # 仅查找视频或音频文件
-                        if file.endswith(('.mp4', '.flv', '.m4a', '.mp3')):
-                            file_path = os.path.join(directory, file)
+                    if file[file.rfind('.'):] in _MEDIA_EXTS:
                         if cid is None or f"_{cid}" in file:  # 如果指定了 CID 则检查文件名是否包含它
                             found_files.append({
                                 "file_name": file,
-                                "file_path": file_path
+                                "file_path": os.path.join(directory, file)
                             })
-        elif cid is not None:
+        elif cid is not None and not found_directory:
             # 如果没有提供 directory 参数但提供了 cid，执行原来的逻辑
-            for root, dirs, files in os.walk(download_dir):
+            for root, dirs, files in _scan_tree(download_dir):
                 # 检查目录名是否包含 CID
                 if f"_{cid}" in os.path.basename(root):
-                    # 如果没有指定目录，保存找到的第一个匹配目录
-                    if not found_directory:
-                        found_directory = root
+                    # 只使用找到的第一个匹配目录，找到后不再继续遍历
+                    found_directory = root
 
-                        # 检查目录中的文件
-                        for file in files:
+                    # 检查目录中的文件
+                    for entry in files:
+                        file = entry.name
                         # 检查文件名是否包含 CID
-                            if f"_{cid}" in file:
-                                # 检查是否为视频或音频文件
-                                if file.endswith(('.mp4', '.flv', '.m4a', '.mp3')):
-                                    file_path = os.path.join(root, file)
-                                    found_files.append({
-                                        "file_name": file,
-                                        "file_path": file_path
-                                    })
+                        if f"_{cid}" in file:
+                            # 检查是否为视频或音频文件
+                            if file[file.rfind('.'):] in _MEDIA_EXTS:
+                                found_files.append({
+                                    "file_name": file,
+                                    "file_path": entry.path
+                                })
+                    break
 
         if not found_files and not found_directory:
             error_message = "未找到匹配的视频文件"
@@ -1528,14 +1860,15 @@ async def stream_danmaku(file_path: Optional[str] = None, cid: Optional[int] = N
                 )
 
             # 递归遍历下载目录查找匹配 CID 的弹幕文件
-            for root, dirs, files in os.walk(download_dir):
+            for root, dirs, files in _scan_tree(download_dir):
                 # 检查目录名是否包含 CID
                 if f"_{cid}" in os.path.basename(root):
                     # 检查目录中的文件
-                    for file in files:
+                    for entry in files:
+                        file = entry.name
                         # 检查是否为弹幕文件
                         if file.endswith('.ass') and f"_{cid}" in file:
-                            danmaku_path = os.path.join(root, file)
+                            danmaku_path = entry.path
                             break
 
                     # 如果在当前目录找到了弹幕文件，就不再继续查找
@@ -1582,53 +1915,15 @@ async def download_user_videos(request: UserSpaceDownloadRequest):
                     detail="未登录：当前设置要求必须登录才能下载视频"
                 )
 
-            # 验证 SESSDATA 是否有效
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-                'Cookie': f'SESSDATA={sessdata}'
-            }
-
-            response = requests.get(
-                'https://api.bilibili.com/x/web-interface/nav',
-                headers=headers,
-                timeout=10
-            )
-
-            data = response.json()
-            if data.get('code') != 0:
+            # 验证 SESSDATA 是否有效（异步请求，不阻塞事件循环）
+            if not await _is_sessdata_valid(sessdata):
                 raise HTTPException(
                     status_code=401,
                     detail="登录已失效：请重新登录"
                 )
 
         # 获取 yutto 可执行文件路径
-        if getattr(sys, 'frozen', False):
-            # 如果是打包后的 exe 运行
-            base_path = os.path.dirname(sys.executable)
-            paths_to_try = [
-                os.path.join(base_path, 'yutto.exe'),  # 尝试主目录
-                os.path.join(base_path, '_internal', 'yutto.exe'),  # 尝试 _internal 目录
-                os.path.join(os.getcwd(), 'yutto.exe'),  # 尝试当前工作目录
-                os.path.join(os.getcwd(), '_internal', 'yutto.exe')  # 尝试当前工作目录的 _internal
-            ]
-
-            yutto_path = None
-            for path in paths_to_try:
-                print(f"尝试路径：{path}")
-                if os.path.exists(path):
-                    yutto_path = path
-                    print(f"找到 yutto.exe: {path}")
-                    break
-
-            if yutto_path is None:
-                raise FileNotFoundError(f"找不到 yutto.exe，已尝试的路径：{', '.join(paths_to_try)}")
-        else:
-            # 如果是直接运行 python 脚本
-            yutto_path = 'yutto'
-            print(f"使用命令：{yutto_path}")
-
-        if not os.path.exists(yutto_path) and getattr(sys, 'frozen', False):
-            raise FileNotFoundError(f"找不到 yutto.exe，已尝试的路径：{yutto_path}")
+        yutto_path = _get_yutto_path()
 
         # 构建命令
         # 确保下载目录和临时目录存在且有正确的权限
@@ -1640,12 +1935,12 @@ async def download_user_videos(request: UserSpaceDownloadRequest):
         os.makedirs(tmp_dir, exist_ok=True)
 
         # 检查目录权限
-        if not os.access(download_dir, os.W_OK):
+        if not _is_writable(download_dir):
             raise HTTPException(
                 status_code=500,
                 detail=f"没有下载目录的写入权限：{download_dir}"
             )
-        if not os.access(tmp_dir, os.W_OK):
+        if not _is_writable(tmp_dir):
             raise HTTPException(
                 status_code=500,
                 detail=f"没有临时目录的写入权限：{tmp_dir}"
@@ -1760,44 +2055,19 @@ async def download_user_videos(request: UserSpaceDownloadRequest):
         # 在 Linux 上确保 PATH 包含 python 环境
         if sys.platform != 'win32':
             env['PATH'] = f"{os.path.dirname(sys.executable)}:{env.get('PATH', '')}"
-            # 添加 virtualenv 的 site-packages 路径（如果存在）
-            site_packages = os.path.join(os.path.dirname(os.path.dirname(sys.executable)), 'lib', 'python*/site-packages')
-            env['PYTHONPATH'] = f"{site_packages}:{env.get('PYTHONPATH', '')}"
-
-        # 准备进程参数
-        popen_kwargs = {
-            'stdout': subprocess.PIPE,
-            'stderr': subprocess.PIPE,
-            'encoding': 'utf-8',
-            'errors': 'replace',
-            'universal_newlines': True,
-            'env': env,
-            'bufsize': 1,  # 行缓冲
-            'shell': sys.platform != 'win32'  # 在非 Windows 系统上使用 shell
-        }
-
-        # 在 Windows 系统上添加 CREATE_NO_WINDOW 标志
-        if sys.platform == 'win32':
-            popen_kwargs['creationflags'] = subprocess.CREATE_NO_WINDOW if hasattr(subprocess, 'CREATE_NO_WINDOW') else 0
-            popen_kwargs['shell'] = False  # Windows 上不使用 shell
-
-        # 在 Linux 上将命令列表转换为字符串，同时处理特殊字符
-        command_str = None
-        if sys.platform != 'win32':
-            command_str = ' '.join(f"'{arg}'" if ((' ' in arg) or ("'" in arg) or ('"' in arg)) else arg for arg in command)
+            # 添加当前 Python 环境的 site-packages 路径（如果存在）
+            env['PYTHONPATH'] = os.pathsep.join(filter(None, [_SITE_PACKAGES, env.get('PYTHONPATH', '')]))
 
         # 执行命令
-        print(f"执行下载命令：{' '.join(command) if sys.platform == 'win32' else command_str}")
+        print(f"执行下载命令：{' '.join(command)}")
 
-        if sys.platform == 'win32':
-            process = subprocess.Popen(command, **popen_kwargs)
-        else:
-            process = subprocess.Popen(command_str, **popen_kwargs)
+        process = await _spawn_yutto(command, env)
 
         # 创建一个响应流
         return StreamingResponse(
             stream_process_output(process),
-            media_type="text/event-stream"
+            media_type="text/event-stream",
+            headers=SSE_HEADERS
         )
 
     except HTTPException:
@@ -1823,53 +2093,15 @@ async def download_favorites(request: FavoriteDownloadRequest):
                 detail="未登录：下载收藏夹必须提供 SESSDATA"
             )
 
-        # 验证 SESSDATA 是否有效
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            'Cookie': f'SESSDATA={sessdata}'
-        }
-
-        response = requests.get(
-            'https://api.bilibili.com/x/web-interface/nav',
-            headers=headers,
-            timeout=10
-        )
-
-        data = response.json()
-        if data.get('code') != 0:
+        # 验证 SESSDATA 是否有效（异步请求，不阻塞事件循环）
+        if not await _is_sessdata_valid(sessdata):
             raise HTTPException(
                 status_code=401,
                 detail="登录已失效：请重新登录"
             )
 
         # 获取 yutto 可执行文件路径
-        if getattr(sys, 'frozen', False):
-            # 如果是打包后的 exe 运行
-            base_path = os.path.dirname(sys.executable)
-            paths_to_try = [
-                os.path.join(base_path, 'yutto.exe'),  # 尝试主目录
-                os.path.join(base_path, '_internal', 'yutto.exe'),  # 尝试 _internal 目录
-                os.path.join(os.getcwd(), 'yutto.exe'),  # 尝试当前工作目录
-                os.path.join(os.getcwd(), '_internal', 'yutto.exe')  # 尝试当前工作目录的 _internal
-            ]
-
-            yutto_path = None
-            for path in paths_to_try:
-                print(f"尝试路径：{path}")
-                if os.path.exists(path):
-                    yutto_path = path
-                    print(f"找到 yutto.exe: {path}")
-                    break
-
-            if yutto_path is None:
-                raise FileNotFoundError(f"找不到 yutto.exe，已尝试的路径：{', '.join(paths_to_try)}")
-        else:
-            # 如果是直接运行 python 脚本
-            yutto_path = 'yutto'
-            print(f"使用命令：{yutto_path}")
-
-        if not os.path.exists(yutto_path) and getattr(sys, 'frozen', False):
-            raise FileNotFoundError(f"找不到 yutto.exe，已尝试的路径：{yutto_path}")
+        yutto_path = _get_yutto_path()
 
         # 构建命令
         # 确保下载目录和临时目录存在且有正确的权限
@@ -1881,12 +2113,12 @@ async def download_favorites(request: FavoriteDownloadRequest):
         os.makedirs(tmp_dir, exist_ok=True)
 
         # 检查目录权限
-        if not os.access(download_dir, os.W_OK):
+        if not _is_writable(download_dir):
             raise HTTPException(
                 status_code=500,
                 detail=f"没有下载目录的写入权限：{download_dir}"
             )
-        if not os.access(tmp_dir, os.W_OK):
+        if not _is_writable(tmp_dir):
             raise HTTPException(
                 status_code=500,
                 detail=f"没有临时目录的写入权限：{tmp_dir}"
@@ -2003,44 +2235,19 @@ async def download_favorites(request: FavoriteDownloadRequest):
         # 在 Linux 上确保 PATH 包含 python 环境
         if sys.platform != 'win32':
             env['PATH'] = f"{os.path.dirname(sys.executable)}:{env.get('PATH', '')}"
-            # 添加 virtualenv 的 site-packages 路径（如果存在）
-            site_packages = os.path.join(os.path.dirname(os.path.dirname(sys.executable)), 'lib', 'python*/site-packages')
-            env['PYTHONPATH'] = f"{site_packages}:{env.get('PYTHONPATH', '')}"
-
-        # 准备进程参数
-        popen_kwargs = {
-            'stdout': subprocess.PIPE,
-            'stderr': subprocess.PIPE,
-            'encoding': 'utf-8',
-            'errors': 'replace',
-            'universal_newlines': True,
-            'env': env,
-            'bufsize': 1,  # 行缓冲
-            'shell': sys.platform != 'win32'  # 在非 Windows 系统上使用 shell
-        }
-
-        # 在 Windows 系统上添加 CREATE_NO_WINDOW 标志
-        if sys.platform == 'win32':
-            popen_kwargs['creationflags'] = subprocess.CREATE_NO_WINDOW if hasattr(subprocess, 'CREATE_NO_WINDOW') else 0
-            popen_kwargs['shell'] = False  # Windows 上不使用 shell
-
-        # 在 Linux 上将命令列表转换为字符串，同时处理特殊字符
-        command_str = None
-        if sys.platform != 'win32':
-            command_str = ' '.join(f"'{arg}'" if ((' ' in arg) or ("'" in arg) or ('"' in arg)) else arg for arg in command)
+            # 添加当前 Python 环境的 site-packages 路径（如果存在）
+            env['PYTHONPATH'] = os.pathsep.join(filter(None, [_SITE_PACKAGES, env.get('PYTHONPATH', '')]))
 
         # 执行命令
-        print(f"执行下载命令：{' '.join(command) if sys.platform == 'win32' else command_str}")
+        print(f"执行下载命令：{' '.join(command)}")
 
-        if sys.platform == 'win32':
-            process = subprocess.Popen(command, **popen_kwargs)
-        else:
-            process = subprocess.Popen(command_str, **popen_kwargs)
+        process = await _spawn_yutto(command, env)
 
         # 创建一个响应流
         return StreamingResponse(
             stream_process_output(process),
-            media_type="text/event-stream"
+            media_type="text/event-stream",
+            headers=SSE_HEADERS
         )
 
     except HTTPException:
@@ -11,6 +11,7 @@ from typing import Optional
 from fastapi import APIRouter, Query, HTTPException
 from pydantic import BaseModel
 
+from scripts import db_pool
 from scripts.utils import get_output_path, load_config
 from scripts.image_downloader import ImageDownloader
 
@@ -796,6 +797,9 @@ async def reset_database():
         db_path = get_output_path(config['db_file'])
         last_import_path = get_output_path('last_import.json')
 
+        # 先关闭连接池中的连接并清空相关缓存，否则连接会继续读写已删除的文件（Windows 上还会导致删除失败）
+        db_pool.reset_pool()
+
         # 删除数据库文件
         if os.path.exists(db_path):
             try:
@@ -0,0 +1,122 @@
+"""
+SQLite 连接池
+
+为只读查询较多的路由提供进程内共享的数据库连接，避免每次请求都重新打开数据库文件、
+重新预热页缓存（SQLite 的页缓存是按连接划分的）。
+"""
+import logging
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from scripts.utils import get_output_path, load_config
+
+# 连接池大小
+POOL_SIZE = 8
+
+# 每个连接初始化时执行一次的 PRAGMA
+# 注意：不修改 journal_mode，history/video_summary 等模块要求数据库保持 DELETE 模式以兼容旧版本，
+# 切换为 WAL 会让这些模块在设置 journal_mode 时因连接池持有连接而报 database is locked
+_PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-64000",
+    # 256MB 内存映射，按 view_at 范围扫描时直接走内核页缓存，省去 read() 系统调用
+    "PRAGMA mmap_size=268435456",
+)
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+# 重置数据库时需要一并清空的、由数据库内容派生的缓存
+_reset_callbacks = []
+
+
+def _connect(db_path: str) -> sqlite3.Connection:
+    """创建并初始化单个连接"""
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    # sqlite3.Row 由 C 实现，既支持下标也支持按列名取值，兼容原有的元组解包写法
+    conn.row_factory = sqlite3.Row
+    for pragma in _PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+def init_pool(size: int = POOL_SIZE) -> None:
+    """填充连接池，重复调用无副作用"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            return
+        db_path = get_output_path(load_config()['db_file'])
+        pool = queue.Queue(maxsize=size)
+        for _ in range(size):
+            pool.put(_connect(db_path))
+        _pool = pool
+        logger.debug("SQLite连接池已初始化，连接数: %d", size)
+
+
+def close_pool() -> None:
+    """关闭连接池中的所有连接"""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is None:
+        return
+    while True:
+        try:
+            conn = pool.get_nowait()
+        except queue.Empty:
+            break
+        try:
+            conn.close()
+        except sqlite3.Error as e:
+            logger.error("关闭数据库连接时出错: %s", e)
+
+
+def on_reset(callback) -> None:
+    """注册数据库重置时调用的回调，用于清空各模块基于数据库内容的缓存"""
+    _reset_callbacks.append(callback)
+
+
+def reset_pool() -> None:
+    """关闭连接池中的连接并清空相关缓存，删除或替换数据库文件前调用
+
+    连接池在下次 borrow() 时按新的数据库文件重新初始化；重置时正被借出的连接
+    归还时会直接关闭，不会再回到新的连接池中。
+    """
+    close_pool()
+    for callback in _reset_callbacks:
+        try:
+            callback()
+        except Exception as e:
+            logger.error("清空数据库缓存时出错: %s", e)
+
+
+@contextmanager
+def borrow():
+    """从连接池借出一个连接，用完后自动归还
+
+    用法:
+        with borrow() as conn:
+            cursor = conn.cursor()
+            ...
+    """
+    if _pool is None:
+        init_pool()
+    pool = _pool
+    conn = pool.get()
+    try:
+        yield conn
+    finally:
+        # 归还前结束未提交的事务，避免把脏状态留给下一个使用者
+        if conn.in_transaction:
+            conn.rollback()
+        # 借出期间连接池已被关闭或重置，旧连接不再归还
+        if pool is _pool:
+            pool.put(conn)
+        else:
+            conn.close()
@@ -1,6 +1,13 @@
 import sqlite3
 from scripts.utils import get_output_path, load_config
 
+def ensure_category_index(cursor):
+    """创建分类表的覆盖索引，按主分类查询/排序时可直接走索引，无需回表和临时排序"""
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_vc_main_sub
+    ON video_categories (main_category, sub_category, alias, tid, image)
+    ''')
+
 def init_categories():
     """初始化视频分类表"""
     config = load_config()
@@ -21,6 +28,8 @@ def init_categories():
             image TEXT
         )
         ''')
+
+        ensure_category_index(cursor)
         
         # 插入数据
         categories_data = [
@@ -453,8 +453,11 @@ def sync_data(db_path=None, json_root_path=None):
         "timestamp": datetime.now().isoformat()
     }
     
-    with open(sync_result_file, 'w', encoding='utf-8') as f:
+    # 先写临时文件再替换，读取方打开的始终是一个完整的结果文件
+    tmp_file = sync_result_file + ".tmp"
+    with open(tmp_file, 'w', encoding='utf-8') as f:
         json.dump(sync_result, f, ensure_ascii=False, indent=4)
+    os.replace(tmp_file, sync_result_file)
     
     logger.info(f"同步结果已保存到 {sync_result_file}")
     
@@ -1,6 +1,8 @@
+import copy
 import os
 import sqlite3
 import sys
+from collections import OrderedDict
 from datetime import datetime
 from typing import Dict, Any
 
@@ -34,8 +36,40 @@ def get_config_path(config_file: str) -> str:
         base_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
         return os.path.join(base_path, 'config', config_file)
 
-def load_config() -> Dict[str, Any]:
-    """加载配置文件并验证"""
+# 优先使用 libyaml 的 C 实现解析，速度比纯 Python 版本快数倍
+_YamlLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+# YAML 文件解析结果缓存: 绝对路径 -> (修改时间ns, 文件大小, 解析结果)，按最近使用淘汰
+_YAML_CACHE_SIZE = 16
+_yaml_cache = OrderedDict()
+
+def load_yaml_cached(path: str) -> Any:
+    """解析YAML文件，文件修改时间和大小都未变化时直接返回缓存的解析结果
+
+    返回的对象为缓存本身，调用方不能修改
+    """
+    path = os.path.abspath(path)
+    st = os.stat(path)
+    entry = _yaml_cache.get(path)
+    if entry is not None and entry[0] == st.st_mtime_ns and entry[1] == st.st_size:
+        _yaml_cache.move_to_end(path)
+        return entry[2]
+
+    with open(path, 'r', encoding='utf-8') as f:
+        data = yaml.load(f, Loader=_YamlLoader)
+
+    _yaml_cache[path] = (st.st_mtime_ns, st.st_size, data)
+    _yaml_cache.move_to_end(path)
+    while len(_yaml_cache) > _YAML_CACHE_SIZE:
+        _yaml_cache.popitem(last=False)
+    return data
+
+def load_config(readonly: bool = False) -> Dict[str, Any]:
+    """加载配置文件并验证，文件未修改时直接使用缓存的解析结果
+
+    Args:
+        readonly: 为 True 时直接返回缓存的配置对象（调用方只能读取），否则返回副本
+    """
     try:
         config_path = get_config_path('config.yaml')
         if not os.path.exists(config_path):
@@ -50,8 +84,7 @@ def load_config() -> Dict[str, Any]:
             logger.debug("=====================\n")
             raise FileNotFoundError(f"配置文件不存在: {config_path}")
 
-        with open(config_path, 'r', encoding='utf-8') as f:
-            config = yaml.safe_load(f)
+        config = load_yaml_cached(config_path)
 
         # 验证邮件配置
         email_config = config.get('email', {})
@@ -61,7 +94,8 @@ def load_config() -> Dict[str, Any]:
         if missing_fields:
             raise ValueError(f"邮件配置缺少必要字段: {', '.join(missing_fields)}")
 
-        return config
+        # 默认返回副本，以免调用方修改影响缓存
+        return config if readonly else copy.deepcopy(config)
     except Exception as e:
         logger.error(f"加载配置文件失败: {str(e)}")
         raise